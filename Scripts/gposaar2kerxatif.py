@@ -12,15 +12,17 @@ Handles mark positioning with proper anchor point indexing for AAT.
 """
 
 import re
-from collections import defaultdict, OrderedDict
+import sys
+from collections import defaultdict
 from typing import Dict, List, Tuple
 
 class AARToATIFConverter:
     def __init__(self):
-        self.mark_groups = OrderedDict()  # group_name -> [(glyph, x, y), ...]
-        self.bases = OrderedDict()  # glyph -> {group_name: (x, y), ...}
-        self.mark2mark = OrderedDict()  # glyph -> {group_name: (x, y), ...}
+        self.mark_groups = defaultdict(list)  # group_name -> [(glyph, x, y), ...]
+        self.bases = defaultdict(dict)  # glyph -> {group_name: (x, y), ...}
+        self.mark2mark = defaultdict(dict)  # glyph -> {group_name: (x, y), ...}
         self.distance_rules = []  # [(glyph1, glyph2, distance, direction), ...]
+        self._class_cache = {}  # (content, class_name) -> [glyph, ...]
         
     def parse_aar(self, content: str):
         """Parse AAR file content"""
@@ -37,9 +39,10 @@ class AARToATIFConverter:
             
             # Parse mark group
             if line.startswith('@mark_group'):
-                group_name = line.split()[1]
+                group_name = sys.intern(line.split()[1])
                 i += 1
-                marks = []
+                # Repeated headers extend the existing group
+                marks = self.mark_groups[group_name]
                 while i < len(lines):
                     line = lines[i].strip()
                     if not line or line.startswith('#'):
@@ -51,9 +54,8 @@ class AARToATIFConverter:
                     match = re.match(r'(\S+)\s+<(-?\d+),\s*(-?\d+)>', line)
                     if match:
                         glyph, x, y = match.groups()
-                        marks.append((glyph, int(x), int(y)))
+                        marks.append((sys.intern(glyph), int(x), int(y)))
                     i += 1
-                self.mark_groups[group_name] = marks
                 continue
             
             # Parse distance adjustment
@@ -77,9 +79,9 @@ class AARToATIFConverter:
             
             # Parse base
             if line.startswith('@base'):
-                glyph = line.split()[1]
+                glyph = sys.intern(line.split()[1])
                 i += 1
-                anchors = {}
+                anchors = self.bases[glyph]
                 while i < len(lines):
                     line = lines[i].strip()
                     if not line or line.startswith('#'):
@@ -91,16 +93,15 @@ class AARToATIFConverter:
                     match = re.match(r'(\S+)\s+<(-?\d+),\s*(-?\d+)>', line)
                     if match:
                         group, x, y = match.groups()
-                        anchors[group] = (int(x), int(y))
+                        anchors[sys.intern(group)] = (int(x), int(y))
                     i += 1
-                self.bases[glyph] = anchors
                 continue
             
             # Parse mark2mark
             if line.startswith('@mark2mark'):
-                glyph = line.split()[1]
+                glyph = sys.intern(line.split()[1])
                 i += 1
-                anchors = {}
+                anchors = self.mark2mark[glyph]
                 while i < len(lines):
                     line = lines[i].strip()
                     if not line or line.startswith('#'):
@@ -112,9 +113,8 @@ class AARToATIFConverter:
                     match = re.match(r'(\S+)\s+<(-?\d+),\s*(-?\d+)>', line)
                     if match:
                         group, x, y = match.groups()
-                        anchors[group] = (int(x), int(y))
+                        anchors[sys.intern(group)] = (int(x), int(y))
                     i += 1
-                self.mark2mark[glyph] = anchors
                 continue
             
             i += 1
@@ -124,16 +124,23 @@ class AARToATIFConverter:
         
         # Strip @ prefix if present
         class_name = class_name.lstrip('@')
+        cache_key = (content, class_name)
+        if cache_key in self._class_cache:
+            return self._class_cache[cache_key]
     
         # Find class definition
         pattern = rf'@class\s+{re.escape(class_name)}\s+=\s+(.+)'
         match = re.search(pattern, content)
-        if match:
-            return match.group(1).strip().split()
-        return []
+        result = match.group(1).strip().split() if match else []
+        self._class_cache[cache_key] = result
+        return result
     
     def generate_atif(self, original_content: str) -> str:
         """Generate ATIF output"""
+        return '\n'.join(self.generate_atif_lines(original_content))
+    
+    def generate_atif_lines(self, original_content: str) -> List[str]:
+        """Generate ATIF output as a list of lines (without newlines)"""
         output = []
         
         # Header
@@ -182,10 +189,18 @@ class AARToATIFConverter:
         output.append("    scan glyphs forward;")
         output.append("")
         
+        # Per-group names used throughout both tables, built once:
+        # (group_name, class_name, transition, action, marks, mark_list)
+        groups = [
+            (group_name, f"marks_{group_name}", f"sawMark_{group_name}",
+             f"snapMark_{group_name}", marks, ', '.join(m[0] for m in marks))
+            for group_name, marks in self.mark_groups.items()
+        ]
+        
         # Define mark anchors (all use index [0])
         output.append("    // Mark anchors (all use index [0])")
         all_marks = set()
-        for group_name, marks in self.mark_groups.items():
+        for _, _, _, _, marks, _ in groups:
             for glyph, x, y in marks:
                 output.append(f"    anchor {glyph}[0] := ({x}, {y});")
                 all_marks.add(glyph)
@@ -193,7 +208,7 @@ class AARToATIFConverter:
         
         # Define base anchors (sequential indices per group)
         output.append("    // Base anchors (sequential indices per semantic)")
-        group_names = list(self.mark_groups.keys())
+        group_names = [group_name for group_name, _, _, _, _, _ in groups]
         for base_glyph, anchors in self.bases.items():
             for idx, group_name in enumerate(group_names):
                 if group_name in anchors:
@@ -206,10 +221,8 @@ class AARToATIFConverter:
         output.append(f"    class bases {{ {', '.join(base_glyphs)} }};")
         output.append("")
         
-        for group_name, marks in self.mark_groups.items():
-            mark_list = [m[0] for m in marks]
-            class_name = f"marks_{group_name}"
-            output.append(f"    class {class_name} {{ {', '.join(mark_list)} }};")
+        for _, class_name, _, _, _, mark_list in groups:
+            output.append(f"    class {class_name} {{ {mark_list} }};")
         output.append("")
         
         # State machine
@@ -218,9 +231,7 @@ class AARToATIFConverter:
         output.append("    };")
         output.append("")
         output.append("    state withBase {")
-        for group_name in self.mark_groups.keys():
-            class_name = f"marks_{group_name}"
-            transition = f"sawMark_{group_name}"
+        for _, class_name, transition, _, _, _ in groups:
             output.append(f"        {class_name}: {transition};")
         output.append("        bases: sawBase;")
         output.append("    };")
@@ -231,22 +242,19 @@ class AARToATIFConverter:
         output.append("    };")
         output.append("")
         
-        for idx, group_name in enumerate(group_names):
-            transition = f"sawMark_{group_name}"
-            action = f"snapMark_{group_name}"
+        for _, _, transition, action, _, _ in groups:
             output.append(f"    transition {transition} {{")
             output.append("        change state to withBase;")
             output.append(f"        kerning action: {action};")
             output.append("    };")
             output.append("")
         
-        for idx, group_name in enumerate(group_names):
-            action = f"snapMark_{group_name}"
+        for idx, (_, _, _, action, _, _) in enumerate(groups):
             output.append(f"    anchor point action {action} {{")
             output.append(f"        marked glyph point: {idx};")
             output.append("        current glyph point: 0;")
             output.append("    };")
-            if idx < len(group_names) - 1:
+            if idx < len(groups) - 1:
                 output.append("")
         
         output.append("};")
@@ -281,12 +289,8 @@ class AARToATIFConverter:
             output.append("")
             
             # All marks as potential attachers
-            all_mark_lists = []
-            for group_name, marks in self.mark_groups.items():
-                mark_list = [m[0] for m in marks]
-                class_name = f"marks_{group_name}"
-                output.append(f"    class {class_name} {{ {', '.join(mark_list)} }};")
-                all_mark_lists.extend(mark_list)
+            for _, class_name, _, _, _, mark_list in groups:
+                output.append(f"    class {class_name} {{ {mark_list} }};")
             output.append("")
             
             # State machine
@@ -295,8 +299,7 @@ class AARToATIFConverter:
             output.append("    };")
             output.append("")
             output.append("    state withBase {")
-            for group_name in self.mark_groups.keys():
-                class_name = f"marks_{group_name}"
+            for _, class_name, _, _, _, _ in groups:
                 output.append(f"        {class_name}: sawMark;")
             output.append("        bases: sawBase;")
             output.append("    };")
@@ -317,12 +320,10 @@ class AARToATIFConverter:
             output.append("    };")
             output.append("};")
         
-        return '\n'.join(output)
+        return output
 
 
 def main():
-    import sys
-    
     if len(sys.argv) != 3:
         print("Usage: python aar_to_atif.py input.aar output.atif")
         sys.exit(1)
@@ -337,11 +338,10 @@ def main():
     # Convert
     converter = AARToATIFConverter()
     converter.parse_aar(content)
-    atif_content = converter.generate_atif(content)
     
     # Write ATIF
     with open(output_file, 'w', encoding='utf-8') as f:
-        f.write(atif_content)
+        f.writelines(line + '\n' for line in converter.generate_atif_lines(content))
     
     print(f"Converted {input_file} -> {output_file}")
 
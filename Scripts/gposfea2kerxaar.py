@@ -12,10 +12,44 @@ KEY PRINCIPLE: Preserve OpenType's mark class grouping
 - AAT anchor indices assigned by group order, not absolute Y values
 """
 
+import argparse
+import io
+import os
 import re
 import sys
 from collections import defaultdict
-from typing import Dict, List, Tuple, Optional, Set
+from itertools import chain
+from statistics import median_high
+from typing import Dict, List, Tuple, Optional, Set, TextIO
+
+# MARK: - Patterns
+
+_CLASS_DEF_RE = re.compile(r'@(\w+)\s*=\s*\[([^\]]+)\];')
+# Match bracketed class or single glyph for both left and right
+# (?:\[\s*([^\]]+)\s*\]|(\S+)) matches either [class] or glyph
+_PAIR_POS_RE = re.compile(r'pos\s+(?:\[\s*([^\]]+)\s*\]|(\S+))\s+(?:\[\s*([^\]]+)\s*\]|(\S+))\s+<(-?\d+)\s+(-?\d+)\s+(-?\d+)\s+(-?\d+)>;')
+# Handle optional brackets: [glyph] or glyph
+_MARKCLASS_RE = re.compile(r'markClass\s+\[?\s*(\S+?)\s*\]?\s+<anchor\s+(-?\d+)\s+(-?\d+)>\s+@(\w+);')
+_ANCHOR_MARK_RE = re.compile(r'<anchor\s+(-?\d+)\s+(-?\d+)>\s+mark\s+@(\w+)')
+# Whitespace-normalised pos base/mark/ligature statement (without its semicolon)
+_POS_BLOCK_RE = re.compile(r'pos (base|mark|ligature) (\S+)(.*)')
+_LOOKUP_NAME_RE = re.compile(r'lookup\s+(\S+)')
+_CONTEXT_LOOKUP_RE = re.compile(r'pos\s+\[?\s*(\S+?)\s*\]?\s+(?:\[([^\]]+)\]|(\S+))\'\s+lookup\s+(\w+);')
+_POS_VALUE_RE = re.compile(r'pos\s+\[?\s*(\S+?)\s*\]?\s+<(-?\d+)\s+(-?\d+)\s+(-?\d+)\s+(-?\d+)>;')
+_COMMENT_RE = re.compile(r'#[^\n]*')
+# One statement or block delimiter: text up to the next ';', '{' or '}'
+_STATEMENT_RE = re.compile(r'(?P<text>[^;{}]*)(?P<end>[;{}])')
+
+# Output section rules
+_HEADER_EQ = "# " + "=" * 76
+_HEADER_DASH = "# " + "-" * 76
+
+# Anchor records emitted for every base, mark2mark and ligature attachment
+_ANCHOR_LINE_FMT = "    %s <%s, %s>\n"
+_ANCHOR_FMT = "<%s, %s>"
+
+# Large buffers keep the many small output writes from turning into many syscalls
+_IO_BUFFER_SIZE = 1 << 20
 
 # MARK: - Data Structures
 
@@ -35,13 +69,10 @@ class SemanticGroup:
     """Group of marks that attach to the same base anchor point"""
     def __init__(self, name: str):
         self.name = name  # e.g., "TOP", "BOTTOM", "ATTACHMENT_0"
-        self.marks: List[Mark] = []
-        self.marks_set: Set[str] = set()  # Track glyph names to avoid duplicates
+        self.marks: Dict[str, Mark] = {}  # glyph -> Mark, first one wins, insertion-ordered
     
     def add_mark(self, mark: Mark):
-        if mark.glyph not in self.marks_set:
-            self.marks.append(mark)
-            self.marks_set.add(mark.glyph)
+        self.marks.setdefault(mark.glyph, mark)
     
     def is_empty(self) -> bool:
         return len(self.marks) == 0
@@ -80,7 +111,12 @@ class LigatureGlyph:
 # MARK: - Main Converter Class
 
 class OTToOT2AAT:
-    def __init__(self):
+    def __init__(self, verbose: bool = False):
+        # Progress messages are buffered and written once per phase;
+        # DEBUG diagnostics are only collected when verbose
+        self.verbose = verbose
+        self._log_buf: List[str] = []
+        
         # Track marks by OpenType class
         # ot_class -> [(glyph, x, y), ...]
         self.ot_marks: Dict[str, List[Tuple[str, int, int]]] = defaultdict(list)
@@ -92,7 +128,7 @@ class OTToOT2AAT:
         self.base_mark_attachments: Dict[str, List[Tuple[str, int, int]]] = defaultdict(list)
         
         # Track ligature attachments: ligature -> {ot_class: [(x, y), ...]}
-        self.ligature_attachments: Dict[str, Dict[str, List[Tuple[int, int]]]] = defaultdict(lambda: defaultdict(list))
+        self.ligature_attachments: Dict[str, Dict[str, List[Tuple[int, int]]]] = {}
         
         # Final semantic groups (computed after parsing)
         self.semantic_groups: Dict[str, SemanticGroup] = {}
@@ -109,19 +145,27 @@ class OTToOT2AAT:
         self.lookups = {}
         self.global_classes: Dict[str, List[str]] = {}
     
+    def _log(self, msg: str):
+        self._log_buf.append(msg)
+    
+    def _flush_log(self):
+        if self._log_buf:
+            sys.stderr.write('\n'.join(self._log_buf) + '\n')
+            self._log_buf.clear()
+    
     def parse_class_definition(self, line: str) -> bool:
         """Parse: @CLASS = [glyph1 glyph2 glyph3];"""
-        pattern = r'@(\w+)\s*=\s*\[([^\]]+)\];'
-        match = re.match(pattern, line.strip())
+        match = _CLASS_DEF_RE.match(line.strip())
         
         if match:
-            class_name = match.group(1)
+            class_name = sys.intern(match.group(1))
             glyphs_str = match.group(2)
-            glyphs = [g.strip() for g in glyphs_str.split() if g.strip()]
+            glyphs = [sys.intern(g) for g in glyphs_str.split()]
             
             if glyphs:
                 self.global_classes[class_name] = glyphs
-                print(f"  Defined class @{class_name} with {len(glyphs)} glyphs", file=sys.stderr)
+                if self.verbose:
+                    self._log(f"  Defined class @{class_name} with {len(glyphs)} glyphs")
             return True
         return False
     
@@ -139,11 +183,7 @@ class OTToOT2AAT:
     
     def parse_pair_positioning(self, line: str) -> bool:
         """Parse: pos [glyph1 glyph2] [glyph3] <xPlacement yPlacement xAdvance yAdvance>;"""
-        
-        # Match bracketed class or single glyph for both left and right
-        # (?:\[\s*([^\]]+)\s*\]|(\S+)) matches either [class] or glyph
-        pattern = r'pos\s+(?:\[\s*([^\]]+)\s*\]|(\S+))\s+(?:\[\s*([^\]]+)\s*\]|(\S+))\s+<(-?\d+)\s+(-?\d+)\s+(-?\d+)\s+(-?\d+)>;'
-        match = re.match(pattern, line.strip())
+        match = _PAIR_POS_RE.match(line.strip())
         
         if match:
             # Left can be group 1 (bracketed) or group 2 (single)
@@ -161,8 +201,8 @@ class OTToOT2AAT:
                 return True  # Valid but nothing to convert
             
             # Handle bracketed classes (split on whitespace) or single glyphs
-            left_glyphs = left_elem.split() if ' ' in left_elem else [left_elem]
-            right_glyphs = right_elem.split() if ' ' in right_elem else [right_elem]
+            left_glyphs = [sys.intern(g) for g in left_elem.split()]
+            right_glyphs = [sys.intern(g) for g in right_elem.split()]
             
             for left in left_glyphs:
                 for right in right_glyphs:
@@ -174,312 +214,209 @@ class OTToOT2AAT:
     
     def parse_markclass(self, line: str):
         """Parse: markClass glyph <anchor X Y> @CLASS;"""
-        # Handle optional brackets: [glyph] or glyph
-        pattern = r'markClass\s+\[?\s*(\S+?)\s*\]?\s+<anchor\s+(-?\d+)\s+(-?\d+)>\s+@(\w+);'
-        match = re.match(pattern, line.strip())
+        match = _MARKCLASS_RE.match(line.strip())
         
         if match:
-            glyph = match.group(1)
+            glyph = sys.intern(match.group(1))
             x = int(match.group(2))
             y = int(match.group(3))
-            ot_class = match.group(4)
+            ot_class = sys.intern(match.group(4))
             
             # Store mark with its OpenType class
             self.ot_marks[ot_class].append((glyph, x, y))
             return True
         return False
     
-    def parse_base(self, lines: List[str], start_idx: int) -> int:
-        """Parse: pos base glyph <anchor X Y> mark @CLASS ..."""
-        line = lines[start_idx].strip()
-        
-        if not line.startswith('pos base '):
-            return 0
-        
-        glyph_match = re.match(r'pos base\s+(\S+)', line)
-        if not glyph_match:
-            return 0
-        
-        glyph = glyph_match.group(1)
-        
-        # Collect full definition
-        full_def = line
-        lines_consumed = 1
-        
-        while not full_def.rstrip().endswith(';'):
-            if start_idx + lines_consumed >= len(lines):
-                break
-            full_def += ' ' + lines[start_idx + lines_consumed].strip()
-            lines_consumed += 1
-        
-        # Find all anchor/mark pairs
-        pattern = r'<anchor\s+(-?\d+)\s+(-?\d+)>\s+mark\s+@(\w+)'
-        matches = re.findall(pattern, full_def)
+    def parse_base(self, glyph: str, body: str):
+        """Parse the anchors of: pos base glyph <anchor X Y> mark @CLASS ..."""
+        matches = _ANCHOR_MARK_RE.findall(body)
         
         for x, y, ot_class in matches:
-            self.base_attachments[glyph].append((ot_class, int(x), int(y)))
-        
-        return lines_consumed
+            self.base_attachments[glyph].append((sys.intern(ot_class), int(x), int(y)))
     
-    def parse_mark2mark(self, lines: List[str], start_idx: int) -> int:
-        """Parse: pos mark glyph <anchor X Y> mark @CLASS;"""
-        line = lines[start_idx].strip()
-        
-        if not line.startswith('pos mark '):
-            return 0
-        
-        glyph_match = re.match(r'pos mark\s+(\S+)', line)
-        if not glyph_match:
-            return 0
-        
-        mark = glyph_match.group(1)
-        
-        # Collect full definition
-        full_def = line
-        lines_consumed = 1
-        
-        while not full_def.rstrip().endswith(';'):
-            if start_idx + lines_consumed >= len(lines):
-                break
-            full_def += ' ' + lines[start_idx + lines_consumed].strip()
-            lines_consumed += 1
-        
-        # Find anchor/mark pairs
-        pattern = r'<anchor\s+(-?\d+)\s+(-?\d+)>\s+mark\s+@(\w+)'
-        matches = re.findall(pattern, full_def)
+    def parse_mark2mark(self, mark: str, body: str):
+        """Parse the anchors of: pos mark glyph <anchor X Y> mark @CLASS;"""
+        matches = _ANCHOR_MARK_RE.findall(body)
         
         for x, y, ot_class in matches:
-            self.base_mark_attachments[mark].append((ot_class, int(x), int(y)))
-        
-        return lines_consumed
+            self.base_mark_attachments[mark].append((sys.intern(ot_class), int(x), int(y)))
     
-    def parse_ligature(self, lines: List[str], start_idx: int) -> int:
-        """Parse: pos ligature glyph <anchor X Y> mark @CLASS ligComponent ..."""
-        line = lines[start_idx].strip()
-        
-        if not line.startswith('pos ligature '):
-            return 0
-        
-        lig_match = re.match(r'pos ligature\s+(\S+)', line)
-        if not lig_match:
-            return 0
-        
-        ligature = lig_match.group(1)
-        
-        # Collect full definition
-        full_def = line
-        lines_consumed = 1
-        
-        while not full_def.rstrip().endswith(';'):
-            if start_idx + lines_consumed >= len(lines):
-                break
-            full_def += ' ' + lines[start_idx + lines_consumed].strip()
-            lines_consumed += 1
-        
-        # Split by ligComponent
-        components = re.split(r'ligComponent', full_def)
-        
-        for component in components:
-            pattern = r'<anchor\s+(-?\d+)\s+(-?\d+)>\s+mark\s+@(\w+)'
-            matches = re.findall(pattern, component)
-            
-            for x, y, ot_class in matches:
-                self.ligature_attachments[ligature][ot_class].append((int(x), int(y)))
-        
-        return lines_consumed
+    def parse_ligature(self, ligature: str, body: str):
+        """Parse the anchors of: pos ligature glyph <anchor X Y> mark @CLASS ligComponent ..."""
+        # Split by ligComponent (plain string split, no regex needed)
+        for component in body.split('ligComponent'):
+            for match in _ANCHOR_MARK_RE.finditer(component):
+                x, y, ot_class = match.groups()
+                ot_class_anchors = self.ligature_attachments.setdefault(ligature, {})
+                ot_class_anchors.setdefault(sys.intern(ot_class), []).append((int(x), int(y)))
     
-    def parse_lookup(self, lines: List[str], start_idx: int) -> int:
-        """Parse lookup definition for positioning rules and value records"""
-        line = lines[start_idx].strip()
+    def parse_attachment(self, statement: str) -> bool:
+        """Parse a pos base/mark/ligature statement, wherever it appears in the file"""
+        match = _POS_BLOCK_RE.match(statement)
+        if not match:
+            return False
+        
+        kind, glyph, body = match.groups()
+        glyph = sys.intern(glyph)
+        
+        if kind == 'base':
+            self.parse_base(glyph, body)
+        elif kind == 'mark':
+            self.parse_mark2mark(glyph, body)
+        else:
+            self.parse_ligature(glyph, body)
+        return True
+    
+    def parse_lookup_statement(self, statement: str, lookup_values: Dict[str, Dict[str, int]]):
+        """Parse one positioning rule or value record inside a lookup block"""
+        # Statements arrive whitespace-normalised, so the keyword is everything up to the first space
+        keyword, _, rest = statement.partition(' ')
         
-        if not line.startswith('lookup '):
-            return 0
+        if keyword == 'markClass':
+            self.parse_markclass(statement)
+            return
         
-        lookup_match = re.match(r'lookup\s+(\S+)', line)
-        if not lookup_match:
-            return 0
+        if keyword != 'pos':
+            return
         
-        lookup_name = lookup_match.group(1)
-        lookup_values = {}
+        contextual = "'" in rest
         
-        lines_consumed = 1
+        if not (contextual or 'mark' in rest or 'base' in rest or 'ligature' in rest):
+            if self.parse_pair_positioning(statement):
+                return
         
-        while start_idx + lines_consumed < len(lines):
-            current_line = lines[start_idx + lines_consumed].strip()
-            
-            if current_line.startswith('}'):
-                lines_consumed += 1
-                break
-            
-            if not current_line or current_line.startswith('#'):
-                lines_consumed += 1
-                continue
+        if contextual and 'lookup' in rest:
+            match = _CONTEXT_LOOKUP_RE.match(statement)
             
-            current_line = re.sub(r'#.*$', '', current_line).strip()
-            
-            if current_line.startswith('markClass'):
-                self.parse_markclass(current_line)
-                lines_consumed += 1
-                continue
-            
-            if current_line.startswith('pos '):
-                if not ('mark' in current_line or 'base' in current_line or
-                        'ligature' in current_line or "'" in current_line):
-                    # Collect full definition (may span multiple lines)
-                    full_def = current_line
-                    temp_consumed = 1
-                    
-                    while not full_def.rstrip().endswith(';'):
-                        if start_idx + lines_consumed + temp_consumed >= len(lines):
-                            break
-                        full_def += ' ' + lines[start_idx + lines_consumed + temp_consumed].strip()
-                        temp_consumed += 1
-                    
-                    if self.parse_pair_positioning(full_def):
-                        lines_consumed += temp_consumed
-                        continue
+            if match:
+                context = sys.intern(match.group(1))
+                targets_in_brackets = match.group(2)
+                single_target = match.group(3)
+                lookup_ref = match.group(4)
                 
-            if current_line.startswith('pos base '):
-                consumed = self.parse_base(lines, start_idx + lines_consumed)
-                if consumed > 0:
-                    lines_consumed += consumed
-                    continue
-            
-            if current_line.startswith('pos mark '):
-                consumed = self.parse_mark2mark(lines, start_idx + lines_consumed)
-                if consumed > 0:
-                    lines_consumed += consumed
-                    continue
-            
-            if current_line.startswith('pos ligature '):
-                consumed = self.parse_ligature(lines, start_idx + lines_consumed)
-                if consumed > 0:
-                    lines_consumed += consumed
-                    continue
-            
-            if "'" in current_line and 'lookup' in current_line:
-                pattern = r'pos\s+\[?\s*(\S+?)\s*\]?\s+(?:\[([^\]]+)\]|(\S+))\'\s+lookup\s+(\w+);'
-                match = re.match(pattern, current_line)
+                targets = targets_in_brackets.split() if targets_in_brackets else [single_target]
                 
-                if match:
-                    context = match.group(1)
-                    targets_in_brackets = match.group(2)
-                    single_target = match.group(3)
-                    lookup_ref = match.group(4)
-                    
-                    targets = targets_in_brackets.split() if targets_in_brackets else [single_target]
+                if lookup_ref in self.lookups:
+                    lookup_values_ref = self.lookups[lookup_ref]
                     
-                    if lookup_ref in self.lookups:
-                        lookup_values_ref = self.lookups[lookup_ref]
-                        
-                        for target in targets:
-                            if target in lookup_values_ref:
-                                values = lookup_values_ref[target]
-                                
-                                x_placement = values['x_placement']
-                                y_placement = values['y_placement']
-                                
-                                if x_placement != 0 and y_placement != 0:
-                                    print(f"Warning: Both x and y placement for {target}, using y_placement only",
-                                          file=sys.stderr)
-                                    direction = 'vertical'
-                                    adjustment = y_placement
-                                elif x_placement != 0:
-                                    direction = 'horizontal'
-                                    adjustment = x_placement
-                                elif y_placement != 0:
-                                    direction = 'vertical'
-                                    adjustment = y_placement
-                                else:
-                                    continue
-                                
-                                self.distance_rules.append((context, target, adjustment, direction))
-                
-                lines_consumed += 1
-                continue
-            
-            pattern = r'pos\s+\[?\s*(\S+?)\s*\]?\s+<(-?\d+)\s+(-?\d+)\s+(-?\d+)\s+(-?\d+)>;'
-            match = re.match(pattern, current_line)
-            
-            if match:
-                glyph = match.group(1)
-                x_placement = int(match.group(2))
-                y_placement = int(match.group(3))
-                x_advance = int(match.group(4))
-                y_advance = int(match.group(5))
-                
-                lookup_values[glyph] = {
-                    'x_placement': x_placement,
-                    'y_placement': y_placement,
-                    'x_advance': x_advance,
-                    'y_advance': y_advance
-                }
-            
-            lines_consumed += 1
+                    for target in targets:
+                        if target in lookup_values_ref:
+                            values = lookup_values_ref[target]
+                            
+                            x_placement = values['x_placement']
+                            y_placement = values['y_placement']
+                            
+                            if x_placement != 0 and y_placement != 0:
+                                self._log(f"Warning: Both x and y placement for {target}, using y_placement only")
+                                direction = 'vertical'
+                                adjustment = y_placement
+                            elif x_placement != 0:
+                                direction = 'horizontal'
+                                adjustment = x_placement
+                            elif y_placement != 0:
+                                direction = 'vertical'
+                                adjustment = y_placement
+                            else:
+                                continue
+                            
+                            self.distance_rules.append((context, target, adjustment, direction))
+            
+            return
+        
+        match = _POS_VALUE_RE.match(statement)
         
-        self.lookups[lookup_name] = lookup_values
-        return lines_consumed
+        if match:
+            glyph = sys.intern(match.group(1))
+            x_placement = int(match.group(2))
+            y_placement = int(match.group(3))
+            x_advance = int(match.group(4))
+            y_advance = int(match.group(5))
+            
+            lookup_values[glyph] = {
+                'x_placement': x_placement,
+                'y_placement': y_placement,
+                'x_advance': x_advance,
+                'y_advance': y_advance
+            }
     
     def compute_semantic_groups(self):
         """Compute semantic groups by deduplicating marks across OpenType classes"""
+        ot_marks = self.ot_marks
+        ot_class_to_semantic = self.ot_class_to_semantic
+        semantic_groups = self.semantic_groups
         
         # Step 1: Build a map of mark identity (glyph, x, y) to all OT classes that define it
-        mark_identity_to_classes: Dict[Tuple[str, int, int], Set[str]] = defaultdict(set)
+        mark_identity_to_classes: Dict[Tuple[str, int, int], Set[str]] = {}
+        classes_for = mark_identity_to_classes.setdefault
         
-        for ot_class, marks in self.ot_marks.items():
+        for ot_class, marks in ot_marks.items():
             for glyph, x, y in marks:
-                mark_identity_to_classes[(glyph, x, y)].add(ot_class)
+                classes_for((glyph, x, y), set()).add(ot_class)
         
         # Step 2: Group OT classes that share marks (they're the same semantic group)
-        ot_class_groups: List[Set[str]] = []
-        processed_classes = set()
-        
-        for ot_class in self.ot_marks.keys():
-            if ot_class in processed_classes:
-                continue
-            
-            # Find all marks in this OT class
-            marks_in_class = {(g, x, y) for g, x, y in self.ot_marks[ot_class]}
-            
-            # Find all OT classes that share these marks
-            related_classes = set([ot_class])
-            for mark_id in marks_in_class:
-                related_classes.update(mark_identity_to_classes[mark_id])
-            
-            ot_class_groups.append(related_classes)
-            processed_classes.update(related_classes)
+        # Union-find over class indices: classes sharing any mark identity are merged
+        class_names = list(ot_marks.keys())
+        class_index = {ot_class: idx for idx, ot_class in enumerate(class_names)}
+        parent = list(range(len(class_names)))
+        rank = [0] * len(class_names)
+        
+        def find(idx: int) -> int:
+            root = idx
+            while parent[root] != root:
+                root = parent[root]
+            while parent[idx] != root:
+                parent[idx], idx = root, parent[idx]
+            return root
+        
+        def union(a: int, b: int):
+            root_a, root_b = find(a), find(b)
+            if root_a == root_b:
+                return
+            if rank[root_a] < rank[root_b]:
+                root_a, root_b = root_b, root_a
+            parent[root_b] = root_a
+            if rank[root_a] == rank[root_b]:
+                rank[root_a] += 1
+        
+        for sharing_classes in mark_identity_to_classes.values():
+            if len(sharing_classes) > 1:
+                first, *rest = (class_index[oc] for oc in sharing_classes)
+                for other in rest:
+                    union(first, other)
+        
+        # Bucket classes by root, keeping the order in which groups first appear
+        groups_by_root: Dict[int, Set[str]] = {}
+        for idx, ot_class in enumerate(class_names):
+            groups_by_root.setdefault(find(idx), set()).add(ot_class)
+        ot_class_groups: List[Set[str]] = list(groups_by_root.values())
         
         # Step 3: For each group, determine representative Y for sorting
+        # Invert the attachment tables once: ot_class -> [y, ...]
+        class_to_base_ys: Dict[str, List[int]] = defaultdict(list)
+        for base_glyph, attachments in self.base_attachments.items():
+            for att_class, x, y in attachments:
+                class_to_base_ys[att_class].append(y)
+        
+        class_to_lig_ys: Dict[str, List[int]] = defaultdict(list)
+        for ligature, ot_class_anchors in self.ligature_attachments.items():
+            for ot_class, anchors in ot_class_anchors.items():
+                class_to_lig_ys[ot_class].extend(y for x, y in anchors)
+        
         group_base_ys = []
         for class_group in ot_class_groups:
             # Collect Y values from bases AND ligatures
-            attachment_ys = []
-            
-            # From base attachments
-            for ot_class in class_group:
-                for base_glyph, attachments in self.base_attachments.items():
-                    for att_class, x, y in attachments:
-                        if att_class in class_group:
-                            attachment_ys.append(y)
-            
-            # From ligature attachments (NEW!)
-            for ot_class in class_group:
-                for ligature, ot_class_anchors in self.ligature_attachments.items():
-                    if ot_class in ot_class_anchors:
-                        for x, y in ot_class_anchors[ot_class]:
-                            attachment_ys.append(y)
+            attachment_ys = [y for oc in class_group for y in class_to_base_ys.get(oc, ())]
+            attachment_ys.extend(y for oc in class_group for y in class_to_lig_ys.get(oc, ()))
             
             # Use median attachment Y, or median mark Y if no attachments
             if attachment_ys:
-                attachment_ys_sorted = sorted(attachment_ys)
-                median_y = attachment_ys_sorted[len(attachment_ys_sorted) // 2]
+                median_y = median_high(attachment_ys)
             else:
                 # No bases or ligatures, use mark Y
                 mark_ys = []
                 for ot_class in class_group:
-                    mark_ys.extend([y for _, _, y in self.ot_marks[ot_class]])
-                mark_ys_sorted = sorted(set(mark_ys))
-                median_y = mark_ys_sorted[len(mark_ys_sorted) // 2] if mark_ys_sorted else 0
+                    mark_ys.extend([y for _, _, y in ot_marks[ot_class]])
+                median_y = median_high(set(mark_ys)) if mark_ys else 0
             
             group_base_ys.append((class_group, median_y))
         
@@ -503,118 +440,161 @@ class OTToOT2AAT:
                 else:
                     semantic_name = "TOP"
             else:
-                semantic_name = f"ATTACHMENT_{idx}"
+                semantic_name = sys.intern(f"ATTACHMENT_{idx}")
             
             # Map all OT classes in this group to the semantic name
             for ot_class in class_group:
-                self.ot_class_to_semantic[ot_class] = semantic_name
+                ot_class_to_semantic[ot_class] = semantic_name
             
             # Create semantic group
-            if semantic_name not in self.semantic_groups:
-                self.semantic_groups[semantic_name] = SemanticGroup(semantic_name)
+            if semantic_name not in semantic_groups:
+                semantic_groups[semantic_name] = SemanticGroup(semantic_name)
             
             # Add unique marks (deduplicated by identity)
-            unique_marks = set()
-            for ot_class in class_group:
-                for glyph, x, y in self.ot_marks[ot_class]:
-                    unique_marks.add((glyph, x, y))
+            unique_marks = set(chain.from_iterable(ot_marks[oc] for oc in class_group))
             
             # Add to semantic group
-            representative_class = list(class_group)[0]
-            for glyph, x, y in sorted(unique_marks):
+            representative_class = next(iter(class_group))
+            marks_list = list(unique_marks)
+            marks_list.sort()
+            for glyph, x, y in marks_list:
                 mark = Mark(glyph, x, y, representative_class)
-                self.semantic_groups[semantic_name].add_mark(mark)
+                semantic_groups[semantic_name].add_mark(mark)
+        
+        log = self._log
+        log(f"\nComputed semantic groups:")
+        for semantic_name, group in sorted(semantic_groups.items()):
+            ot_classes = [oc for oc, sn in ot_class_to_semantic.items() if sn == semantic_name]
+            log(f"  {semantic_name}: {len(group.marks)} unique marks from OT classes: {', '.join(sorted(ot_classes))}")
+        
+        if not self.verbose:
+            return
         
-        print(f"\nComputed semantic groups:", file=sys.stderr)
-        for semantic_name, group in sorted(self.semantic_groups.items()):
-            ot_classes = [oc for oc, sn in self.ot_class_to_semantic.items() if sn == semantic_name]
-            print(f"  {semantic_name}: {len(group.marks)} unique marks from OT classes: {', '.join(sorted(ot_classes))}", file=sys.stderr)
-                    
         # DEBUG: Show what we found
-        print(f"\nDEBUG - OT class groups detected: {len(ot_class_groups)}", file=sys.stderr)
+        log(f"\nDEBUG - OT class groups detected: {len(ot_class_groups)}")
         for idx, (class_group, median_y) in enumerate(group_base_ys):
-            print(f"  Group {idx}: classes={sorted(class_group)}, median_y={median_y}", file=sys.stderr)
+            log(f"  Group {idx}: classes={sorted(class_group)}, median_y={median_y}")
         
         # DEBUG: Show ligature attachments
-        print(f"\nDEBUG - Ligature attachments:", file=sys.stderr)
+        log(f"\nDEBUG - Ligature attachments:")
         for lig, classes in self.ligature_attachments.items():
-            print(f"  {lig}:", file=sys.stderr)
+            log(f"  {lig}:")
             for ot_class, anchors in classes.items():
-                print(f"    {ot_class}: {anchors}", file=sys.stderr)
-
-
-            
+                log(f"    {ot_class}: {anchors}")
     
     def build_structured_data(self):
         """Build final structured data for output"""
+        # Simple mapping: OT class → semantic group
+        get_semantic = self.ot_class_to_semantic.get
+        bases = self.bases
+        base_marks = self.base_marks
+        ligatures = self.ligatures
         
         # Build bases - preserve OpenType anchor order
         for base_glyph, attachments in self.base_attachments.items():
-            if base_glyph not in self.bases:
-                self.bases[base_glyph] = BaseGlyph(base_glyph)
+            base = bases.get(base_glyph)
+            if base is None:
+                base = bases[base_glyph] = BaseGlyph(base_glyph)
             
-            for ot_class, x, y in attachments:
-                # Simple mapping: OT class → semantic group
-                semantic_name = self.ot_class_to_semantic.get(ot_class, "ATTACHMENT_0")
-                self.bases[base_glyph].add_attachment(semantic_name, x, y)
+            base.attachments.update(
+                (get_semantic(ot_class, "ATTACHMENT_0"), (x, y)) for ot_class, x, y in attachments)
         
         # Build base marks
-        for base_mark, attachments in self.base_mark_attachments.items():
-            if base_mark not in self.base_marks:
-                self.base_marks[base_mark] = BaseMarkGlyph(base_mark)
+        for mark, attachments in self.base_mark_attachments.items():
+            base_mark = base_marks.get(mark)
+            if base_mark is None:
+                base_mark = base_marks[mark] = BaseMarkGlyph(mark)
             
-            for ot_class, x, y in attachments:
-                semantic_name = self.ot_class_to_semantic.get(ot_class, "ATTACHMENT_0")
-                self.base_marks[base_mark].add_attachment(semantic_name, x, y)
+            base_mark.attachments.update(
+                (get_semantic(ot_class, "ATTACHMENT_0"), (x, y)) for ot_class, x, y in attachments)
         
         # Build ligatures
         for ligature, ot_class_anchors in self.ligature_attachments.items():
-            if ligature not in self.ligatures:
-                self.ligatures[ligature] = LigatureGlyph(ligature)
+            lig = ligatures.get(ligature)
+            if lig is None:
+                lig = ligatures[ligature] = LigatureGlyph(ligature)
             
             for ot_class, anchors in ot_class_anchors.items():
-                semantic_name = self.ot_class_to_semantic.get(ot_class, "ATTACHMENT_0")
-                
-                for x, y in anchors:
-                    self.ligatures[ligature].add_component_anchor(semantic_name, x, y)
-                        
-                        
+                lig.component_anchors[get_semantic(ot_class, "ATTACHMENT_0")].extend(anchors)
+    
+    def sort_structured_data(self):
+        """Rebuild output tables in key order so emission is plain iteration"""
+        self.global_classes = dict(sorted(self.global_classes.items()))
+        self.semantic_groups = dict(sorted(self.semantic_groups.items()))
+        self.bases = dict(sorted(self.bases.items()))
+        self.base_marks = dict(sorted(self.base_marks.items()))
+        self.ligatures = dict(sorted(self.ligatures.items()))
+        
+        for glyph in chain(self.bases.values(), self.base_marks.values()):
+            glyph.attachments = dict(sorted(glyph.attachments.items()))
+        for lig in self.ligatures.values():
+            lig.component_anchors = dict(sorted(lig.component_anchors.items()))
+    
     def parse_file(self, content: str):
         """Parse entire OpenType feature file"""
-        lines = content.split('\n')
-        i = 0
-        
-        print(f"Parsing {len(lines)} lines...", file=sys.stderr)
-        
-        while i < len(lines):
-            line = lines[i].strip()
-            
-            if not line or line.startswith('#'):
-                i += 1
-                continue
-            
-            line = re.sub(r'#.*$', '', line).strip()
-            
-            if line.startswith('@') and '=' in line:
-                if self.parse_class_definition(line):
-                    i += 1
+        # Most generated feature files carry few comments; skip the regex entirely
+        # when there are none
+        if '#' in content:
+            content = _COMMENT_RE.sub('', content)
+        
+        num_lines = content.count('\n') + 1
+        print(f"Parsing {num_lines} lines...", file=sys.stderr)
+        
+        # Walk the file once, one statement at a time; blocks track which lookup
+        # (if any) each open brace belongs to
+        blocks: List[Optional[str]] = []
+        lookup_name: Optional[str] = None
+        lookup_values: Dict[str, Dict[str, int]] = {}
+        lookup_line = 0
+        line_no, line_pos = 1, 0
+        parse_attachment = self.parse_attachment
+        parse_class_definition = self.parse_class_definition
+        parse_lookup_statement = self.parse_lookup_statement
+        verbose = self.verbose
+        
+        for match in _STATEMENT_RE.finditer(content):
+            chunk = match.group()
+            terminator = match.group('end')
+            statement = ' '.join(match.group('text').split())
+            
+            if terminator == ';':
+                # Mark attachments are collected in and out of lookup blocks
+                if parse_attachment(statement):
                     continue
+                if lookup_name is not None:
+                    parse_lookup_statement(statement + ';', lookup_values)
+                elif statement.startswith('@') and '=' in statement:
+                    parse_class_definition(statement + ';')
+            
+            elif terminator == '{':
+                lookup_match = _LOOKUP_NAME_RE.match(statement)
+                if lookup_name is None and lookup_match:
+                    lookup_name = sys.intern(lookup_match.group(1))
+                    lookup_values = {}
+                    if verbose:
+                        start = match.start() + len(chunk) - len(chunk.lstrip())
+                        line_no += content.count('\n', line_pos, start)
+                        line_pos = start
+                        lookup_line = line_no
+                    blocks.append(lookup_name)
+                else:
+                    blocks.append(None)
             
-            consumed = self.parse_lookup(lines, i)
-            if consumed > 0:
-                print(f"  Parsed lookup at line {i+1}", file=sys.stderr)
-                i += consumed
-                continue
-            
-            i += 1
+            elif blocks and blocks.pop() is not None:
+                self.lookups[lookup_name] = lookup_values
+                if verbose:
+                    self._log(f"  Parsed lookup at line {lookup_line}")
+                lookup_name = None
         
         # Compute semantic groups from parsed data
         self.compute_semantic_groups()
         
         # Build structured data
         self.build_structured_data()
+        self.sort_structured_data()
         
         # Print summary
+        self._flush_log()
         print(f"\nParsed content:", file=sys.stderr)
         print(f"  Global classes: {len(self.global_classes)}", file=sys.stderr)
         print(f"  OpenType mark classes: {len(self.ot_marks)}", file=sys.stderr)
@@ -624,183 +604,173 @@ class OTToOT2AAT:
         print(f"  Ligatures: {len(self.ligatures)}", file=sys.stderr)
         print(f"  Distance rules: {len(self.distance_rules)}", file=sys.stderr)
     
-    def generate_output(self) -> str:
-        """Generate ot2aat format"""
-        output = []
-        
-        output.append("# " + "=" * 76)
-        output.append("# Converted from OpenType GPOS format to ot2aat format")
-        output.append("# Preserving OpenType mark class grouping")
-        output.append("# " + "=" * 76)
-        output.append("")
+    def generate_output(self, out: Optional[TextIO] = None) -> Optional[str]:
+        """Generate ot2aat format, streaming to out if given, else returning a string"""
+        if out is not None:
+            self.write_output(out)
+            return None
+        
+        buf = io.StringIO()
+        self.write_output(buf)
+        return buf.getvalue()
+    
+    def write_output(self, out: TextIO):
+        """Write ot2aat format to a text stream"""
+        # Every section ends with a blank separator line; the last character
+        # written is held back until more output follows, so the separator after
+        # the final section is dropped and the file ends with a single newline
+        held = ''
+
+        def w(text: str):
+            nonlocal held
+            if text:
+                out.write(held + text[:-1])
+                held = text[-1]
+
+        w(f"{_HEADER_EQ}\n"
+          "# Converted from OpenType GPOS format to ot2aat format\n"
+          "# Preserving OpenType mark class grouping\n"
+          f"{_HEADER_EQ}\n\n")
         
         # Global classes
         if self.global_classes:
-            output.append("# " + "-" * 76)
-            output.append("# GLOBAL CLASS DEFINITIONS")
-            output.append("# " + "-" * 76)
-            output.append("")
+            w(f"{_HEADER_DASH}\n# GLOBAL CLASS DEFINITIONS\n{_HEADER_DASH}\n\n")
             
-            for class_name in sorted(self.global_classes.keys()):
-                glyphs = self.global_classes[class_name]
-                output.append(f"@class {class_name} = {' '.join(glyphs)}")
+            for class_name, glyphs in self.global_classes.items():
+                w(f"@class {class_name} = {' '.join(glyphs)}\n")
             
-            output.append("")
+            w("\n")
         
         # Mark groups
         if self.semantic_groups:
-            output.append("# " + "-" * 76)
-            output.append("# MARK GROUPS")
-            output.append("# " + "-" * 76)
-            output.append("#")
-            output.append("# Groups derived from OpenType mark classes.")
-            output.append("# In AAT, all marks use anchor index [0].")
-            output.append("# Bases use different indices [0], [1], [2]... for each group.")
-            output.append("# " + "-" * 76)
-            output.append("")
-            
-            # Output in consistent order
-            for group_name in sorted(self.semantic_groups.keys()):
-                group = self.semantic_groups[group_name]
+            w(f"{_HEADER_DASH}\n"
+              "# MARK GROUPS\n"
+              f"{_HEADER_DASH}\n"
+              "#\n"
+              "# Groups derived from OpenType mark classes.\n"
+              "# In AAT, all marks use anchor index [0].\n"
+              "# Bases use different indices [0], [1], [2]... for each group.\n"
+              f"{_HEADER_DASH}\n\n")
+            
+            for group_name, group in self.semantic_groups.items():
                 if group.is_empty():
                     continue
                 
-                output.append(f"@mark_group {group_name}")
+                w(f"@mark_group {group_name}\n")
                 
-                for mark in group.marks:
-                    output.append(f"    {mark.glyph} {mark.anchor_str()}")
+                for mark in group.marks.values():
+                    w(f"    {mark.glyph} {mark.anchor_str()}\n")
                 
-                output.append("")
+                w("\n")
         
         # Distance rules
         if self.distance_rules:
-            output.append("# " + "-" * 76)
-            output.append("# DISTANCE ADJUSTMENTS")
-            output.append("# " + "-" * 76)
-            output.append("")
+            w(f"{_HEADER_DASH}\n# DISTANCE ADJUSTMENTS\n{_HEADER_DASH}\n\n")
             
+            # Group by context, tracking whether all of a context's rules share one
+            # (adjustment, direction); None marks a context with mixed values
             by_context = defaultdict(list)
+            uniform: Dict[str, Optional[Tuple[int, str]]] = {}
             for context, target, adjustment, direction in self.distance_rules:
                 by_context[context].append((target, adjustment, direction))
+                value = (adjustment, direction)
+                shared = uniform.setdefault(context, value)
+                if shared is not None and shared != value:
+                    uniform[context] = None
             
-            for context in sorted(by_context.keys()):
-                rules = by_context[context]
-                adjustments = set((adj, dir) for _, adj, dir in rules)
+            for context, rules in sorted(by_context.items()):
+                shared = uniform[context]
                 
-                if len(adjustments) == 1 and len(rules) > 1:
+                if shared is not None and len(rules) > 1:
                     targets = [target for target, _, _ in rules]
-                    adjustment, direction = list(adjustments)[0]
+                    adjustment, direction = shared
                     
                     class_name = f"TARGETS_{context.replace('.', '_')}"
-                    output.append(f"@class {class_name} = {' '.join(sorted(targets))}")
-                    output.append(f"@distance {context} @{class_name} {adjustment} {direction}")
-                    output.append("")
+                    w(f"@class {class_name} = {' '.join(sorted(targets))}\n"
+                      f"@distance {context} @{class_name} {adjustment} {direction}\n\n")
                 else:
                     for target, adjustment, direction in sorted(rules):
-                        output.append(f"@distance {context} {target} {adjustment} {direction}")
-                    output.append("")
+                        w(f"@distance {context} {target} {adjustment} {direction}\n")
+                    w("\n")
         
         # Mark-to-base
         if self.bases:
-            output.append("# " + "-" * 76)
-            output.append("# MARK-TO-BASE")
-            output.append("# " + "-" * 76)
-            output.append("")
+            w(f"{_HEADER_DASH}\n# MARK-TO-BASE\n{_HEADER_DASH}\n\n")
             
-            for glyph in sorted(self.bases.keys()):
-                base = self.bases[glyph]
-                
-                output.append(f"@base {glyph}")
+            for glyph, base in self.bases.items():
+                w(f"@base {glyph}\n")
                 
-                for group_name in sorted(base.attachments.keys()):
-                    x, y = base.attachments[group_name]
-                    output.append(f"    {group_name} <{x}, {y}>")
+                for group_name, (x, y) in base.attachments.items():
+                    w(_ANCHOR_LINE_FMT % (group_name, x, y))
                 
-                output.append("")
+                w("\n")
         
         # Mark-to-mark
         if self.base_marks:
-            output.append("# " + "-" * 76)
-            output.append("# MARK-TO-MARK")
-            output.append("# " + "-" * 76)
-            output.append("")
+            w(f"{_HEADER_DASH}\n# MARK-TO-MARK\n{_HEADER_DASH}\n\n")
             
-            for mark in sorted(self.base_marks.keys()):
-                base_mark = self.base_marks[mark]
-                
-                output.append(f"@mark2mark {mark}")
+            for mark, base_mark in self.base_marks.items():
+                w(f"@mark2mark {mark}\n")
                 
-                for group_name in sorted(base_mark.attachments.keys()):
-                    x, y = base_mark.attachments[group_name]
-                    output.append(f"    {group_name} <{x}, {y}>")
+                for group_name, (x, y) in base_mark.attachments.items():
+                    w(_ANCHOR_LINE_FMT % (group_name, x, y))
                 
-                output.append("")
+                w("\n")
         
         # Mark-to-ligature
         if self.ligatures:
-            output.append("# " + "-" * 76)
-            output.append("# MARK-TO-LIGATURE")
-            output.append("# " + "-" * 76)
-            output.append("")
-            
-            for ligature in sorted(self.ligatures.keys()):
-                lig = self.ligatures[ligature]
-                
-                output.append(f"@ligature {ligature}")
-                
-                for group_name in sorted(lig.component_anchors.keys()):
-                    anchors = lig.component_anchors[group_name]
-                    line = f"    {group_name}"
-                    for x, y in anchors:
-                        line += f" <{x}, {y}>"
-                    output.append(line)
-                
-                output.append("")
-        
-        return '\n'.join(output)
+            w(f"{_HEADER_DASH}\n# MARK-TO-LIGATURE\n{_HEADER_DASH}\n\n")
+            
+            # Each ligature record is assembled locally and written in one call
+            for ligature, lig in self.ligatures.items():
+                record = [f"@ligature {ligature}\n"]
+                record.extend(
+                    "    %s %s\n" % (group_name, ' '.join([_ANCHOR_FMT % anchor for anchor in anchors]))
+                    for group_name, anchors in lig.component_anchors.items()
+                )
+                record.append("\n")
+                w(''.join(record))
 
 
 def main():
-    if len(sys.argv) < 2:
-        print("Usage: python3 gposfea2kerxaar.py input.fea [output.aar]")
-        print()
-        print("Convert OpenType GPOS (positioning) features to ot2aat format")
-        print()
-        print("Scope: GPOS only (kerning, marks, distance)")
-        print("       GSUB (substitution) is out of scope")
-        print()
-        print("Examples:")
-        print("  python3 gposfea2kerxaar.py marks.fea")
-        print("  python3 gposfea2kerxaar.py marks.fea converted.aar")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(
+        description='Convert OpenType GPOS (positioning) features to ot2aat format',
+        epilog='Scope: GPOS only (kerning, marks, distance); GSUB (substitution) is out of scope'
+    )
+    parser.add_argument('input', help='Input .fea file')
+    parser.add_argument('output', nargs='?', help='Output .aar file (default: stdout)')
+    parser.add_argument('--verbose', action='store_true', help='Print per-group DEBUG diagnostics')
     
-    input_file = sys.argv[1]
-    output_file = sys.argv[2] if len(sys.argv) > 2 else None
+    args = parser.parse_args()
+    input_file = args.input
+    output_file = args.output
+    verbose = args.verbose
     
-    try:
-        with open(input_file, 'r', encoding='utf-8') as f:
-            content = f.read()
-    except FileNotFoundError:
+    if not os.path.isfile(input_file):
         print(f"Error: File not found: {input_file}")
         sys.exit(1)
+    
+    try:
+        # One bulk read and decode rather than going through a text wrapper
+        with open(input_file, 'rb') as f:
+            content = f.read().decode('utf-8')
     except Exception as e:
         print(f"Error reading file: {e}")
         sys.exit(1)
     
-    converter = OTToOT2AAT()
+    converter = OTToOT2AAT(verbose=verbose)
     converter.parse_file(content)
-    output = converter.generate_output()
     
     if output_file:
         try:
-            with open(output_file, 'w', encoding='utf-8') as f:
-                f.write(output)
+            with open(output_file, 'w', encoding='utf-8', buffering=_IO_BUFFER_SIZE) as f:
+                converter.generate_output(out=f)
             print(f"\nSuccessfully converted to: {output_file}")
-        except Exception as e:
+        except OSError as e:
             print(f"Error writing file: {e}")
             sys.exit(1)
     else:
-        print(output)
+        converter.generate_output(out=sys.stdout)
     
     print(f"\nConversion complete!", file=sys.stderr)
 
@@ -23,41 +23,68 @@ Features:
 - Skips empty lookups
 """
 
+import io
 import re
 import sys
 import argparse
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, Iterable, Iterator, List, Tuple, Optional, TextIO
+
+# MARK: - Patterns
+
+_CLASS_DEF_RE = re.compile(r'@(\w+)\s*=\s*\[([^\]]+)\];')
+# One contextual pattern element: [inline class] or glyph/@class, either optionally
+# marked with ', or a '[' with no closing bracket
+_CONTEXT_TOKEN_RE = re.compile(r"\[([^\]]*)\]('?)|([^\s\[\]]+)|\[")
+_FEATURE_RE = re.compile(r'feature\s+(\w+)')
+_SCRIPT_RE = re.compile(r'script\s+(\w+);')
+_LOOKUP_REF_RE = re.compile(r'lookup\s+(\S+);')
+_LOOKUP_BLOCK_RE = re.compile(r'lookup\s+(\S+)\s*\{')
+
+# Output section rules
+_HEADER_EQ = "# " + "=" * 76
+_HEADER_DASH = "# " + "-" * 76
 
 # MARK: - Data Structures
 
 class LookupInfo:
     """Metadata about a lookup"""
+    __slots__ = ('name', 'scripts', 'features', 'is_prefix', 'scripts_str')
+    
     def __init__(self, name: str):
         self.name = name
         self.scripts = []
         self.features = []
         self.is_prefix = False
+        self.scripts_str = ''  # Sorted, comma-joined scripts for feature headers
 
 
 class SingleSubstitution:
+    __slots__ = ('source', 'target')
+    
     def __init__(self, source: str, target: str):
         self.source = source
         self.target = target
 
 
 class LigatureSubstitution:
+    __slots__ = ('target', 'components')
+    
     def __init__(self, target: str, components: List[str]):
         self.target = target
         self.components = components
 
 
 class MultipleSubstitution:
+    __slots__ = ('source', 'targets')
+    
     def __init__(self, source: str, targets: List[str]):
         self.source = source
         self.targets = targets
 
 
 class ContextualSubstitution:
+    __slots__ = ('context', 'marked_indices', 'substitutions', 'lookup_refs')
+    
     def __init__(self, context: List[str], marked_indices: List[int],
                  substitutions: Dict[int, str], lookup_refs: Dict[int, str]):
         self.context = context
@@ -67,6 +94,8 @@ class ContextualSubstitution:
 
 
 class RearrangementRule:
+    __slots__ = ('input_sequence', 'output_sequence')
+    
     def __init__(self, input_sequence: List[str], output_sequence: List[str]):
         self.input_sequence = input_sequence
         self.output_sequence = output_sequence
@@ -74,12 +103,17 @@ class RearrangementRule:
 
 class RearrangementPattern:
     """Stores unresolved rearrangement pattern with lookup references"""
+    __slots__ = ('glyphs', 'lookup_refs')
+    
     def __init__(self, glyphs: List[str], lookup_refs: List[str]):
         self.glyphs = glyphs
         self.lookup_refs = lookup_refs
 
 
 class ParsedLookup:
+    __slots__ = ('info', 'single_subs', 'ligatures', 'multiple_subs', 'contextual_subs',
+                 'rearrangement_rules', 'rearrangement_patterns', 'local_classes', 'lookupflags')
+    
     def __init__(self, info: LookupInfo):
         self.info = info
         self.single_subs: List[SingleSubstitution] = []
@@ -89,7 +123,15 @@ class ParsedLookup:
         self.rearrangement_rules: List[RearrangementRule] = []
         self.rearrangement_patterns: List[RearrangementPattern] = []
         self.local_classes: Dict[str, List[str]] = {}
-        self.raw_lines: List[str] = []
+        self.lookupflags: List[str] = []  # lookupflag statements; sub lines are not retained
+    
+    def freeze(self):
+        """Store the parsed rule lists as tuples once the lookup body is complete"""
+        self.single_subs = tuple(self.single_subs)
+        self.ligatures = tuple(self.ligatures)
+        self.multiple_subs = tuple(self.multiple_subs)
+        self.contextual_subs = tuple(self.contextual_subs)
+        self.rearrangement_patterns = tuple(self.rearrangement_patterns)
     
     def is_empty(self) -> bool:
         """Check if lookup has any content"""
@@ -101,49 +143,70 @@ class ParsedLookup:
 # MARK: - Main Converter Class
 
 class GSUBToAAR:
-    def __init__(self, script_filter: Optional[List[str]] = None):
+    def __init__(self, script_filter: Optional[List[str]] = None, verbose: bool = False):
+        # Per-lookup progress messages are only printed when verbose
+        self.verbose = verbose
         self.script_filter = script_filter
+        self.script_filter_set = frozenset(script_filter or ())
         self.all_lookups: Dict[str, ParsedLookup] = {}
         self.feature_order: List[Tuple[str, str, str]] = []
         self.global_classes: Dict[str, List[str]] = {}
+        self.global_classes_rendered: Dict[str, str] = {}  # Space-joined glyphs, in name order
         self.inline_classes: Dict[str, List[str]] = {}  # Generated classes
+        self.inline_class_names: Dict[Tuple[str, ...], str] = {}  # glyphs -> generated class name
+        self.pattern_element_refs: Dict[str, str] = {}  # pattern element -> output form, classified once
+        self.local_class_index: Dict[str, List[str]] = {}  # Lookup-local classes, first definition wins
+        self.class_expansions: Dict[str, Tuple[str, ...]] = {}  # '@NAME' -> glyphs, global classes win
+        self.substitution_maps: Dict[str, Dict[str, str]] = {}  # lookup -> {source: target}, built after parsing
+        self.included_lookups: Dict[str, ParsedLookup] = {}  # Lookups to emit, in feature order
         self.class_counter = 0
+        self.num_lines = 0
+        
+        # Statements are told apart by their first character, built once per converter;
+        # anything else (blank lines, languagesystem, ...) is skipped
+        self.top_level_dispatch = {
+            'l': self.parse_top_level_lookup,
+            '@': self.parse_top_level_class,
+            'f': self.parse_top_level_feature,
+        }
+        self.body_dispatch = {
+            'l': self.parse_lookupflag_statement,
+            '@': self.parse_local_class_statement,
+            's': self.parse_substitution_statement,
+        }
     
     def parse_class_definition(self, line: str, class_dict: Dict[str, List[str]]) -> bool:
-        pattern = r'@(\w+)\s*=\s*\[([^\]]+)\];'
-        match = re.match(pattern, line.strip())
+        match = _CLASS_DEF_RE.match(line)
         if match:
-            class_name = match.group(1)
-            glyphs = [g.strip() for g in match.group(2).split() if g.strip()]
+            class_name = sys.intern(match.group(1))
+            glyphs = [sys.intern(g) for g in match.group(2).split()]
             if glyphs:
                 class_dict[class_name] = glyphs
             return True
         return False
     
-    def expand_class_reference(self, element: str) -> List[str]:
+    def expand_class_reference(self, element: str) -> Tuple[str, ...]:
+        expansion = self.class_expansions.get(element)
+        if expansion is not None:
+            return expansion
         if element.startswith('@'):
-            class_name = element[1:]
-            if class_name in self.global_classes:
-                return self.global_classes[class_name]
-            for lookup in self.all_lookups.values():
-                if class_name in lookup.local_classes:
-                    return lookup.local_classes[class_name]
-            print(f"Warning: Undefined class @{class_name}", file=sys.stderr)
-            return []
-        return [element]
+            print(f"Warning: Undefined class {element}", file=sys.stderr)
+            return ()
+        return (element,)
     
     def register_inline_class(self, glyphs: List[str]) -> str:
         """Register an inline class and return a unique class name"""
         # Check if this exact class already exists
         glyphs_tuple = tuple(glyphs)
-        for class_name, existing_glyphs in self.inline_classes.items():
-            if tuple(existing_glyphs) == glyphs_tuple:
-                return f"@{class_name}"
+        class_name = self.inline_class_names.get(glyphs_tuple)
+        if class_name is not None:
+            return f"@{class_name}"
         
         # Generate new class name
         self.class_counter += 1
         class_name = f"CLASS_{self.class_counter:03d}"
-        self.inline_classes[class_name] = glyphs
+        self.inline_classes[class_name] = [sys.intern(g) for g in glyphs]
+        self.inline_class_names[glyphs_tuple] = class_name
         return f"@{class_name}"
     
     def process_pattern_element(self, element: str) -> str:
@@ -151,112 +214,80 @@ class GSUBToAAR:
         Process a pattern element: if it's an inline class, register it and return class reference.
         Otherwise return the element as-is.
         """
+        ref = self.pattern_element_refs.get(element)
+        if ref is not None:
+            return ref
+        
+        ref = element
         if element.startswith('[') and element.endswith(']'):
             # Extract glyphs from inline class
-            glyphs = [g.strip() for g in element[1:-1].split() if g.strip()]
+            glyphs = element[1:-1].split()
             if glyphs:
-                return self.register_inline_class(glyphs)
-        return element
+                ref = self.register_inline_class(glyphs)
+        self.pattern_element_refs[element] = ref
+        return ref
     
-    def detect_substitution_type(self, line: str) -> Optional[str]:
-        line = line.strip()
-        if not line.startswith('sub '):
-            return None
-        # Check for contextual with "by lookup" syntax
-        if 'by lookup' in line:
-            return 'contextual'
-        # If it has ' and lookup_ (inline lookup references), it's rearrangement
-        if "'" in line and 'lookup_' in line and 'by lookup' not in line:
-            return None  # Let parse_inline_lookup_contextual handle it
-        # Regular substitution patterns
-        parts = line.split(' by ')
-        if len(parts) != 2:
-            return None
-        left = parts[0].replace('sub ', '').strip().split()
-        right = parts[1].rstrip(';').strip().split()
-        if len(left) == 1 and len(right) > 1:
-            return 'multiple'
-        if len(left) > 1 and len(right) == 1:
-            return 'ligature'
+    def parse_simple_substitution(self, line: str, lookup: ParsedLookup) -> bool:
+        """
+        Parse a single, ligature or multiple substitution: tokenize once with plain
+        string scans, classify by token counts and build the record directly
+        """
+        head, by, tail = line.partition(' by ')
+        if not by or ' by ' in tail:
+            return False
+        tail, semicolon, _ = tail.partition(';')
+        if not semicolon:
+            return False
+        
+        left = [sys.intern(g) for g in head[4:].split()]
+        right = [sys.intern(g) for g in tail.split()]
+        # A single output glyph must run right up to the ';' ("sub a by b ;" is not
+        # converted); multiple substitutions may have space before it
+        if len(right) == 1 and tail[-1:].isspace():
+            return False
         if len(left) == 1 and len(right) == 1:
-            return 'single'
-        return None
-    
-    def parse_single_substitution(self, line: str, lookup: ParsedLookup) -> bool:
-        pattern = r'sub\s+(\S+)\s+by\s+(\S+);'
-        match = re.match(pattern, line.strip())
-        if match:
-            lookup.single_subs.append(SingleSubstitution(match.group(1), match.group(2)))
-            return True
-        return False
-    
-    def parse_ligature(self, line: str, lookup: ParsedLookup) -> bool:
-        pattern = r'sub\s+(.*?)\s+by\s+(\S+);'
-        match = re.match(pattern, line.strip())
-        if match:
-            components = [c.strip() for c in match.group(1).split() if c.strip()]
-            if len(components) > 1:
-                lookup.ligatures.append(LigatureSubstitution(match.group(2), components))
-                return True
-        return False
-    
-    def parse_multiple_substitution(self, line: str, lookup: ParsedLookup) -> bool:
-        pattern = r'sub\s+(\S+)\s+by\s+(.*?);'
-        match = re.match(pattern, line.strip())
-        if match:
-            targets = [t.strip() for t in match.group(2).split() if t.strip()]
-            if len(targets) > 1:
-                lookup.multiple_subs.append(MultipleSubstitution(match.group(1), targets))
-                return True
-        return False
+            lookup.single_subs.append(SingleSubstitution(left[0], right[0]))
+        elif len(left) == 1 and len(right) > 1:
+            lookup.multiple_subs.append(MultipleSubstitution(left[0], right))
+        elif len(left) > 1 and len(right) == 1:
+            lookup.ligatures.append(LigatureSubstitution(right[0], left))
+        else:
+            return False
+        return True
     
     def parse_contextual_substitution(self, line: str, lookup: ParsedLookup) -> bool:
         if 'by lookup' not in line:
             return False
         
-        pattern = r'sub\s+(.*?)\s+by\s+(lookup_\d+);'
-        match = re.match(pattern, line.strip())
-        if not match:
+        # sub <pattern> by lookup_N; split with plain string scans
+        if not line.startswith('sub '):
+            return False
+        head, by, tail = line.partition(' by ')
+        lookup_name, semicolon, _ = tail.partition(';')
+        # The lookup name must run right up to the ';', as in 'by lookup_3;'
+        lookup_name = lookup_name.lstrip()
+        if not semicolon or not lookup_name.startswith('lookup_') or not lookup_name[7:].isdigit():
             return False
         
-        pattern_part = match.group(1).strip()
-        lookup_name = match.group(2).strip()
+        pattern_part = head[4:]
         
         elements = []
         marked_indices = []
-        idx = 0
-        i = 0
         
-        while i < len(pattern_part):
-            while i < len(pattern_part) and pattern_part[i].isspace():
-                i += 1
-            if i >= len(pattern_part):
-                break
-            
-            if pattern_part[i] == '[':
-                end = pattern_part.find(']', i)
-                if end == -1:
-                    break
-                class_content = pattern_part[i+1:end]
-                is_marked = (end + 1 < len(pattern_part) and pattern_part[end + 1] == "'")
-                elements.append('[' + class_content + ']')
-                if is_marked:
-                    marked_indices.append(idx)
-                    i = end + 2
-                else:
-                    i = end + 1
-                idx += 1
-            else:
-                start = i
-                while i < len(pattern_part) and not pattern_part[i].isspace() and pattern_part[i] not in '[]':
-                    i += 1
-                token = pattern_part[start:i]
+        for token_match in _CONTEXT_TOKEN_RE.finditer(pattern_part):
+            class_content, class_mark, token = token_match.groups()
+            if token is not None:
                 if token.endswith("'"):
-                    elements.append(token[:-1])
-                    marked_indices.append(idx)
-                else:
-                    elements.append(token)
-                idx += 1
+                    marked_indices.append(len(elements))
+                    token = token[:-1]
+                elements.append(sys.intern(token))
+            elif class_content is not None:
+                if class_mark:
+                    marked_indices.append(len(elements))
+                elements.append(sys.intern('[' + class_content + ']'))
+            else:
+                # Unterminated inline class: ignore the rest of the pattern
+                break
         
         if not elements or not marked_indices:
             return False
@@ -274,12 +305,11 @@ class GSUBToAAR:
             return False
         
         # Match pattern with multiple marked positions and inline lookups
-        pattern = r'sub\s+(.*?);'
-        match = re.match(pattern, line.strip())
-        if not match:
+        if not line.startswith('sub '):
+            return False
+        pattern_part, semicolon, _ = line[4:].partition(';')
+        if not semicolon:
             return False
-        
-        pattern_part = match.group(1).strip()
         
         # Parse tokens: glyph', lookup_X, glyph', lookup_Y
         tokens = pattern_part.split()
@@ -292,12 +322,12 @@ class GSUBToAAR:
             token = tokens[i]
             if token.endswith("'"):
                 # Marked glyph
-                glyph = token[:-1]
+                glyph = sys.intern(token[:-1])
                 glyphs.append(glyph)
                 
                 # Next token should be lookup reference
                 if i + 1 < len(tokens) and tokens[i + 1].startswith('lookup_'):
-                    lookups.append(tokens[i + 1])
+                    lookups.append(sys.intern(tokens[i + 1]))
                     i += 2
                 else:
                     return False
@@ -313,104 +343,123 @@ class GSUBToAAR:
         )
         return True
     
-    def parse_lookup_body(self, lines: List[str], start_idx: int, lookup: ParsedLookup) -> int:
-        lines_consumed = 0
-        while start_idx + lines_consumed < len(lines):
-            current_line = lines[start_idx + lines_consumed].strip()
-            if current_line.startswith('}'):
-                lines_consumed += 1
+    def parse_lookupflag_statement(self, line: str, lookup: ParsedLookup):
+        if line.startswith('lookupflag'):
+            lookup.lookupflags.append(line)
+    
+    def parse_local_class_statement(self, line: str, lookup: ParsedLookup):
+        if '=' in line:
+            self.parse_class_definition(line, lookup.local_classes)
+    
+    def parse_substitution_statement(self, line: str, lookup: ParsedLookup):
+        if not line.startswith('sub '):
+            return
+        # Check for contextual with "by lookup" syntax
+        if 'by lookup' in line:
+            self.parse_contextual_substitution(line, lookup)
+        # Lines with ' and lookup_ (inline lookup references), or that are not a
+        # regular substitution, are tried as rearrangement
+        elif ("'" in line and 'lookup_' in line) or not self.parse_simple_substitution(line, lookup):
+            self.parse_inline_lookup_contextual(line, lookup)
+    
+    def parse_lookup_body(self, source: Iterator[str], lookup: ParsedLookup):
+        """Consume lookup body lines from source up to and including the closing brace"""
+        dispatch = self.body_dispatch
+        for current_line in source:
+            first = current_line[:1]
+            if first == '}':
                 break
-            if not current_line or current_line.startswith('#'):
-                lines_consumed += 1
-                continue
-            current_line = re.sub(r'#.*$', '', current_line).strip()
-            if current_line.startswith('lookupflag'):
-                lookup.raw_lines.append(current_line)
-                lines_consumed += 1
-                continue
-            if current_line.startswith('@') and '=' in current_line:
-                self.parse_class_definition(current_line, lookup.local_classes)
-                lines_consumed += 1
-                continue
-            if current_line.startswith('sub '):
-                sub_type = self.detect_substitution_type(current_line)
-                if sub_type == 'single':
-                    self.parse_single_substitution(current_line, lookup)
-                elif sub_type == 'ligature':
-                    self.parse_ligature(current_line, lookup)
-                elif sub_type == 'multiple':
-                    self.parse_multiple_substitution(current_line, lookup)
-                elif sub_type == 'contextual':
-                    self.parse_contextual_substitution(current_line, lookup)
-                else:
-                    # Try parsing as inline lookup contextual (rearrangement)
-                    self.parse_inline_lookup_contextual(current_line, lookup)
-                lookup.raw_lines.append(current_line)
-            lines_consumed += 1
-        return lines_consumed
-    
-    def parse_feature_block(self, lines: List[str], start_idx: int) -> int:
-        line = lines[start_idx].strip()
-        feature_match = re.match(r'feature\s+(\w+)', line)
+            handler = dispatch.get(first)
+            if handler is not None:
+                handler(current_line, lookup)
+    
+    def parse_feature_block(self, line: str, source: Iterator[str]):
+        """Consume a feature block whose header is line, recording its lookup references"""
+        feature_match = _FEATURE_RE.match(line)
         if not feature_match:
-            return 0
+            return
         
-        feature_name = feature_match.group(1)
-        lines_consumed = 1
+        feature_name = sys.intern(feature_match.group(1))
         current_script = None
         
-        while start_idx + lines_consumed < len(lines):
-            current_line = lines[start_idx + lines_consumed].strip()
+        for current_line in source:
             if current_line.startswith('}'):
-                lines_consumed += 1
                 break
-            script_match = re.match(r'script\s+(\w+);', current_line)
+            script_match = _SCRIPT_RE.match(current_line)
             if script_match:
-                current_script = script_match.group(1)
-                lines_consumed += 1
+                current_script = sys.intern(script_match.group(1))
                 continue
-            lookup_match = re.match(r'lookup\s+(\S+);', current_line)
+            lookup_match = _LOOKUP_REF_RE.match(current_line)
             if lookup_match:
-                lookup_name = lookup_match.group(1)
+                lookup_name = sys.intern(lookup_match.group(1))
                 self.feature_order.append((feature_name, current_script or 'DFLT', lookup_name))
-            lines_consumed += 1
-        return lines_consumed
+    
+    def parse_top_level_lookup(self, line: str, source: Iterator[str]):
+        """Parse a top-level lookup block whose header is line"""
+        if not line.startswith('lookup '):
+            return
+        lookup_match = _LOOKUP_BLOCK_RE.match(line)
+        if not lookup_match:
+            return
+        
+        lookup_name = sys.intern(lookup_match.group(1))
+        info = LookupInfo(lookup_name)
+        parsed_lookup = ParsedLookup(info)
+        self.parse_lookup_body(source, parsed_lookup)
+        parsed_lookup.freeze()
+        self.all_lookups[lookup_name] = parsed_lookup
+        if self.verbose:
+            print(f"  Parsed lookup {lookup_name}: single={len(parsed_lookup.single_subs)}, lig={len(parsed_lookup.ligatures)}, mult={len(parsed_lookup.multiple_subs)}, ctx={len(parsed_lookup.contextual_subs)}, reorder_pat={len(parsed_lookup.rearrangement_patterns)}", file=sys.stderr)
+    
+    def parse_top_level_class(self, line: str, source: Iterator[str]):
+        """Parse a global class definition"""
+        if '=' in line:
+            self.parse_class_definition(line, self.global_classes)
+    
+    def parse_top_level_feature(self, line: str, source: Iterator[str]):
+        """Parse a feature block whose header is line"""
+        if line.startswith('feature '):
+            self.parse_feature_block(line, source)
+    
+    def clean_lines(self, lines: Iterable[str]) -> Iterator[str]:
+        """Yield source lines with comments and surrounding whitespace removed, counting them"""
+        for line in lines:
+            self.num_lines += 1
+            hash_pos = line.find('#')
+            if hash_pos >= 0:
+                line = line[:hash_pos]
+            yield line.strip()
     
     def parse_file(self, content: str):
-        lines = content.split('\n')
-        i = 0
-        print(f"Parsing {len(lines)} lines...", file=sys.stderr)
+        """Parse FEA source held in a string"""
+        self.parse_lines(content.split('\n'))
+    
+    def parse_lines(self, lines: Iterable[str]):
+        """Parse FEA source one line at a time, e.g. straight from an open file"""
+        print("Parsing...", file=sys.stderr)
+        
+        # Block parsers pull their body lines from the same cleaned stream, so only
+        # the current line is held in memory
+        source = self.clean_lines(lines)
+        
+        dispatch = self.top_level_dispatch
+        for line in source:
+            handler = dispatch.get(line[:1])
+            if handler is not None:
+                handler(line, source)
+        
+        # Index lookup-local classes and single substitutions once, so contextual and
+        # rearrangement rules resolve them with a dict lookup
+        for lookup_name, lookup in self.all_lookups.items():
+            for class_name, glyphs in lookup.local_classes.items():
+                self.local_class_index.setdefault(class_name, glyphs)
+            self.substitution_maps[lookup_name] = {sub.source: sub.target for sub in lookup.single_subs}
         
-        while i < len(lines):
-            line = lines[i].strip()
-            if not line or line.startswith('#'):
-                i += 1
-                continue
-            
-            if line.startswith('lookup '):
-                lookup_match = re.match(r'lookup\s+(\S+)\s*\{', line)
-                if lookup_match:
-                    lookup_name = lookup_match.group(1)
-                    info = LookupInfo(lookup_name)
-                    parsed_lookup = ParsedLookup(info)
-                    i += 1
-                    consumed = self.parse_lookup_body(lines, i, parsed_lookup)
-                    i += consumed
-                    self.all_lookups[lookup_name] = parsed_lookup
-                    print(f"  Parsed lookup {lookup_name}: single={len(parsed_lookup.single_subs)}, lig={len(parsed_lookup.ligatures)}, mult={len(parsed_lookup.multiple_subs)}, ctx={len(parsed_lookup.contextual_subs)}, reorder_pat={len(parsed_lookup.rearrangement_patterns)}", file=sys.stderr)
-                    continue
-            
-            if line.startswith('@') and '=' in line:
-                self.parse_class_definition(line, self.global_classes)
-                i += 1
-                continue
-            
-            if line.startswith('feature '):
-                consumed = self.parse_feature_block(lines, i)
-                if consumed > 0:
-                    i += consumed
-                    continue
-            i += 1
+        # Keep global classes in name order for output; sorted once here
+        self.global_classes = dict(sorted(self.global_classes.items()))
+        self.global_classes_rendered = {name: ' '.join(glyphs) for name, glyphs in self.global_classes.items()}
+        self.class_expansions = {f"@{name}": tuple(glyphs) for name, glyphs in self.local_class_index.items()}
+        self.class_expansions.update((f"@{name}", tuple(glyphs)) for name, glyphs in self.global_classes.items())
         
         # Mark prefix lookups and assign scripts
         referenced_lookups = set()
@@ -422,16 +471,24 @@ class GSUBToAAR:
                     lookup.info.features.append(feature_name)
                 if script and script not in lookup.info.scripts:
                     lookup.info.scripts.append(script)
-                print(f"  Assigned feature={feature_name}, script={script} to {lookup_name}", file=sys.stderr)
+                if self.verbose:
+                    print(f"  Assigned feature={feature_name}, script={script} to {lookup_name}", file=sys.stderr)
             else:
                 print(f"  WARNING: {lookup_name} referenced in features but not found!", file=sys.stderr)
         
         for lookup_name, lookup in self.all_lookups.items():
             if lookup_name not in referenced_lookups:
                 lookup.info.is_prefix = True
+            lookup.info.scripts_str = ', '.join(sorted(lookup.info.scripts))
         
         print(f"\nParsed content:", file=sys.stderr)
+        print(f"  Lines: {self.num_lines}", file=sys.stderr)
         print(f"  Total lookups: {len(self.all_lookups)}", file=sys.stderr)
+        lookups = self.all_lookups.values()
+        print(f"  Substitutions: single={sum(len(l.single_subs) for l in lookups)}, "
+              f"lig={sum(len(l.ligatures) for l in lookups)}, "
+              f"mult={sum(len(l.multiple_subs) for l in lookups)}, "
+              f"ctx={sum(len(l.contextual_subs) for l in lookups)}", file=sys.stderr)
         print(f"  Prefix lookups: {sum(1 for l in self.all_lookups.values() if l.info.is_prefix)}", file=sys.stderr)
         print(f"  Feature lookups: {sum(1 for l in self.all_lookups.values() if not l.info.is_prefix)}", file=sys.stderr)
         print(f"  Feature order entries: {len(self.feature_order)}", file=sys.stderr)
@@ -439,24 +496,26 @@ class GSUBToAAR:
     
     def should_include_lookup(self, lookup: ParsedLookup) -> bool:
         if lookup.info.is_prefix:
-            print(f"  Skipping {lookup.info.name}: is_prefix", file=sys.stderr)
+            if self.verbose:
+                print(f"  Skipping {lookup.info.name}: is_prefix", file=sys.stderr)
             return False
         if lookup.is_empty():
-            print(f"  Skipping {lookup.info.name}: is_empty", file=sys.stderr)
+            if self.verbose:
+                print(f"  Skipping {lookup.info.name}: is_empty", file=sys.stderr)
             return False
         if not self.script_filter:
             return True
-        has_script = any(script in lookup.info.scripts for script in self.script_filter)
+        has_script = not self.script_filter_set.isdisjoint(lookup.info.scripts)
         if not has_script:
-            print(f"  Skipping {lookup.info.name}: no matching script (has: {lookup.info.scripts})", file=sys.stderr)
+            if self.verbose:
+                print(f"  Skipping {lookup.info.name}: no matching script (has: {lookup.info.scripts})", file=sys.stderr)
         return has_script
     
     def inline_lookup_substitutions(self, lookup_name: str) -> Dict[str, str]:
         if lookup_name not in self.all_lookups:
             print(f"ERROR: Lookup '{lookup_name}' not found!", file=sys.stderr)
             return {}
-        lookup = self.all_lookups[lookup_name]
-        return {sub.source: sub.target for sub in lookup.single_subs}
+        return self.substitution_maps[lookup_name]
     
     def resolve_rearrangement_pattern(self, pattern: RearrangementPattern) -> Optional[RearrangementRule]:
         """Resolve a rearrangement pattern by looking up the substitutions"""
@@ -499,7 +558,7 @@ class GSUBToAAR:
         target_element = ctx.context[marked_pos]
         if target_element.startswith('[') and target_element.endswith(']'):
             # It's an inline class - extract individual glyphs
-            valid_sources = [g.strip() for g in target_element[1:-1].split() if g.strip()]
+            valid_sources = target_element[1:-1].split()
         else:
             # It's a glyph or class reference - expand it
             valid_sources = self.expand_class_reference(target_element)
@@ -513,163 +572,126 @@ class GSUBToAAR:
         if not all_subs:
             return [f"# ERROR: No substitutions in {lookup_name}"]
         
-        # Filter substitutions to only those matching valid sources
+        # Filter substitutions to only those matching valid sources, hashing them once
+        valid_sources = set(valid_sources)
         filtered_subs = {src: tgt for src, tgt in all_subs.items() if src in valid_sources}
         if not filtered_subs:
             return [f"# ERROR: No matching substitutions for {target_element}"]
         
-        # Generate rules - one per marked glyph substitution
-        rules = []
         pattern_length = len(ctx.context)
         
         if pattern_length == 1:
             # Single element pattern - shouldn't happen in contextual
             return [f"# ERROR: Single element context pattern: {' '.join(ctx.context)}"]
         
-        # Multi-element pattern - determine context type based on marked position
-        if marked_pos == 0:
-            # Marked at beginning - use "before" context
-            # Pattern: marked_glyph following_context
-            # Build the following context (everything after marked position)
-            context_parts = []
-            for i in range(1, pattern_length):
-                context_parts.append(self.process_pattern_element(ctx.context[i]))
-            context_str = ' '.join(context_parts)
-            
-            for source, target in filtered_subs.items():
-                rules.append(f"before {context_str}: {source} => {target}")
+        # Multi-element pattern - process each unmarked context element once, then
+        # pick the context type from the marked position:
+        #   marked at beginning -> "before <following>"
+        #   marked at end       -> "after <preceding>"
+        #   marked in middle    -> "between <preceding> and <following>"
+        process = self.process_pattern_element
+        before_str = ' '.join([process(element) for element in ctx.context[:marked_pos]])
+        after_str = ' '.join([process(element) for element in ctx.context[marked_pos + 1:]])
         
+        if marked_pos == 0:
+            prefix = f"before {after_str}"
         elif marked_pos == pattern_length - 1:
-            # Marked at end - use "after" context
-            # Pattern: preceding_context marked_glyph
-            # Build the preceding context (everything before marked position)
-            context_parts = []
-            for i in range(0, marked_pos):
-                context_parts.append(self.process_pattern_element(ctx.context[i]))
-            context_str = ' '.join(context_parts)
-            
-            for source, target in filtered_subs.items():
-                rules.append(f"after {context_str}: {source} => {target}")
-        
+            prefix = f"after {before_str}"
         else:
-            # Marked in middle - use "between" context
-            # Pattern: before_context marked_glyph after_context
-            # Build before context
-            before_parts = []
-            for i in range(0, marked_pos):
-                before_parts.append(self.process_pattern_element(ctx.context[i]))
-            before_str = ' '.join(before_parts)
-            
-            # Build after context
-            after_parts = []
-            for i in range(marked_pos + 1, pattern_length):
-                after_parts.append(self.process_pattern_element(ctx.context[i]))
-            after_str = ' '.join(after_parts)
-            
-            for source, target in filtered_subs.items():
-                rules.append(f"between {before_str} and {after_str}: {source} => {target}")
+            prefix = f"between {before_str} and {after_str}"
         
-        return rules
+        # Generate rules - one per marked glyph substitution
+        return [f"{prefix}: {source} => {target}" for source, target in filtered_subs.items()]
     
-    def generate_lookup_output(self, lookup: ParsedLookup) -> List[str]:
+    def write_lookup_output(self, out: TextIO, lookup: ParsedLookup):
         # Resolve rearrangement patterns first
         for pattern in lookup.rearrangement_patterns:
             rule = self.resolve_rearrangement_pattern(pattern)
             if rule:
                 lookup.rearrangement_rules.append(rule)
         
-        output = []
-        output.append("# " + "-" * 76)
-        output.append(f"# Lookup: {lookup.info.name}")
+        w = out.write
+        w(f"{_HEADER_DASH}\n# Lookup: {lookup.info.name}\n")
         if lookup.info.features:
-            output.append(f"# Features: {', '.join(lookup.info.features)}")
+            w(f"# Features: {', '.join(lookup.info.features)}\n")
         if lookup.info.scripts:
-            output.append(f"# Scripts: {', '.join(lookup.info.scripts)}")
-        output.append("# " + "-" * 76)
+            w(f"# Scripts: {', '.join(lookup.info.scripts)}\n")
+        w(f"{_HEADER_DASH}\n")
         
-        has_lookupflag = any('lookupflag' in line.lower() for line in lookup.raw_lines)
-        if has_lookupflag:
-            output.append("# NOTE: Original lookup has lookupflag - AAT uses exact sequential matching")
+        if lookup.lookupflags:
+            w("# NOTE: Original lookup has lookupflag - AAT uses exact sequential matching\n")
         
         if lookup.single_subs:
-            output.append("@simple {")
-            for sub in lookup.single_subs:
-                output.append(f"    {sub.source} -> {sub.target}")
-            output.append("}")
+            w("@simple {\n")
+            w(''.join([f"    {sub.source} -> {sub.target}\n" for sub in lookup.single_subs]))
+            w("}\n")
         
         if lookup.ligatures:
-            output.append("@ligature {")
-            for lig in lookup.ligatures:
-                components = ' + '.join(lig.components)
-                output.append(f"    {lig.target} := {components}")
-            output.append("}")
+            w("@ligature {\n")
+            w(''.join([f"    {lig.target} := {' + '.join(lig.components)}\n" for lig in lookup.ligatures]))
+            w("}\n")
         
         if lookup.multiple_subs:
-            output.append("@one2many {")
-            for mult in lookup.multiple_subs:
-                targets = ' '.join(mult.targets)
-                output.append(f"    {mult.source} > {targets}")
-            output.append("}")
+            w("@one2many {\n")
+            w(''.join([f"    {mult.source} > {' '.join(mult.targets)}\n" for mult in lookup.multiple_subs]))
+            w("}\n")
         
         if lookup.rearrangement_rules:
-            output.append("@reorder {")
-            for reorder in lookup.rearrangement_rules:
-                input_seq = ' '.join(reorder.input_sequence)
-                output_seq = ' '.join(reorder.output_sequence)
-                output.append(f"    {input_seq} > {output_seq}")
-            output.append("}")
+            w("@reorder {\n")
+            w(''.join([f"    {' '.join(reorder.input_sequence)} > {' '.join(reorder.output_sequence)}\n"
+                       for reorder in lookup.rearrangement_rules]))
+            w("}\n")
         
         if lookup.contextual_subs:
-            output.append("@contextual {")
+            w("@contextual {\n")
             
             # Group rules by context
-            from collections import OrderedDict
-            grouped_rules = OrderedDict()
+            grouped_rules: Dict[str, List[str]] = {}
             
             for ctx in lookup.contextual_subs:
                 rules_with_keys = self.generate_contextual_rules(ctx)
                 for item in rules_with_keys:
                     if len(item) == 2:
                         context_key, rule = item
-                        if context_key not in grouped_rules:
-                            grouped_rules[context_key] = []
-                        grouped_rules[context_key].append(rule)
+                        grouped_rules.setdefault(context_key, []).append(rule)
                     else:
                         # Error case - just append the rule directly
-                        if "error" not in grouped_rules:
-                            grouped_rules["error"] = []
-                        grouped_rules["error"].append(str(item))
+                        grouped_rules.setdefault("error", []).append(str(item))
             
             # Output grouped rules with comments
             for context_key, rules in grouped_rules.items():
+                rules_text = ''.join([f"    {rule}\n" for rule in rules])
                 if context_key.startswith('error'):
                     # Error case
-                    for rule in rules:
-                        output.append(f"    {rule}")
+                    w(rules_text)
                 else:
-                    # Add descriptive comment for each context group
-                    output.append(f"    # Pattern: {context_key}")
-                    for rule in rules:
-                        output.append(f"    {rule}")
-                    output.append("")  # Blank line between groups
+                    # Add descriptive comment for each context group, blank line between groups
+                    w(f"    # Pattern: {context_key}\n{rules_text}\n")
             
-            output.append("}")
+            w("}\n")
         
-        output.append("")
-        return output
+        w("\n")
     
-    def preprocess_inline_classes(self):
-        """Pre-process all contextual rules to collect inline classes before output generation"""
-        print("Pre-processing inline classes...", file=sys.stderr)
+    def index_included_lookups(self):
+        """Decide once, in feature order, which referenced lookups will be emitted"""
+        self.included_lookups = {}
+        checked = set()
         
         for feature_name, script, lookup_name in self.feature_order:
-            if lookup_name not in self.all_lookups:
-                continue
-            
-            lookup = self.all_lookups[lookup_name]
-            if not self.should_include_lookup(lookup):
+            if lookup_name in checked:
                 continue
+            checked.add(lookup_name)
             
+            lookup = self.all_lookups.get(lookup_name)
+            if lookup is not None and self.should_include_lookup(lookup):
+                self.included_lookups[lookup_name] = lookup
+    
+    def preprocess_inline_classes(self):
+        """Pre-process all contextual rules to collect inline classes before output generation"""
+        print("Pre-processing inline classes...", file=sys.stderr)
+        self.index_included_lookups()
+        
+        for lookup in self.included_lookups.values():
             # Process all contextual substitutions to register inline classes
             for ctx in lookup.contextual_subs:
                 # Process each element in the context pattern
@@ -680,71 +702,74 @@ class GSUBToAAR:
         
         print(f"  Collected {len(self.inline_classes)} inline classes", file=sys.stderr)
     
-    def generate_output(self) -> str:
+    def generate_output(self, out: Optional[TextIO] = None) -> Optional[str]:
+        """Generate .aar output, streaming to out if given, else returning a string"""
+        if out is not None:
+            self.write_output(out)
+            return None
+        
+        buf = io.StringIO()
+        self.write_output(buf)
+        return buf.getvalue()
+    
+    def write_output(self, out: TextIO):
+        """Write .aar output to a text stream"""
         # Pre-process to collect all inline classes first
         self.preprocess_inline_classes()
         
-        output = []
-        output.append("# " + "=" * 76)
-        output.append("# Converted from OpenType GSUB to unified .aar format")
-        output.append("# Source: FEA converted from TTX (ttx -t GSUB font.otf)")
+        w = out.write
+        w(f"{_HEADER_EQ}\n"
+          "# Converted from OpenType GSUB to unified .aar format\n"
+          "# Source: FEA converted from TTX (ttx -t GSUB font.otf)\n")
         if self.script_filter:
-            output.append(f"# Script filter: {', '.join(self.script_filter)}")
-        output.append("# " + "=" * 76)
-        output.append("")
+            w(f"# Script filter: {', '.join(self.script_filter)}\n")
+        w(f"{_HEADER_EQ}\n\n")
         
         # Output global classes (from FEA file)
         if self.global_classes:
-            output.append("# " + "-" * 76)
-            output.append("# GLOBAL CLASS DEFINITIONS (from source)")
-            output.append("# " + "-" * 76)
-            output.append("")
-            for class_name in sorted(self.global_classes.keys()):
-                glyphs = self.global_classes[class_name]
-                output.append(f"@class {class_name} = {' '.join(glyphs)}")
-            output.append("")
+            w(f"{_HEADER_DASH}\n# GLOBAL CLASS DEFINITIONS (from source)\n{_HEADER_DASH}\n\n")
+            w(''.join([f"@class {class_name} = {rendered}\n"
+                       for class_name, rendered in self.global_classes_rendered.items()]))
+            w("\n")
         
         # Output generated inline classes
         if self.inline_classes:
-            output.append("# " + "-" * 76)
-            output.append("# GENERATED CLASS DEFINITIONS (from inline classes)")
-            output.append("# " + "-" * 76)
-            output.append("")
+            w(f"{_HEADER_DASH}\n# GENERATED CLASS DEFINITIONS (from inline classes)\n{_HEADER_DASH}\n\n")
             for class_name in sorted(self.inline_classes.keys()):
                 glyphs = self.inline_classes[class_name]
-                output.append(f"@class {class_name} = {' '.join(glyphs)}")
-            output.append("")
+                w(f"@class {class_name} = {' '.join(glyphs)}\n")
+            w("\n")
         
         current_feature = None
         processed_lookups = set()
+        feature_headers: Dict[Tuple[str, str], str] = {}  # (feature, scripts) -> banner block
         
         print(f"\nGenerating output...", file=sys.stderr)
         
         for feature_name, script, lookup_name in self.feature_order:
             if lookup_name not in self.all_lookups:
-                print(f"  Lookup {lookup_name} not in all_lookups", file=sys.stderr)
+                if self.verbose:
+                    print(f"  Lookup {lookup_name} not in all_lookups", file=sys.stderr)
                 continue
             
-            lookup = self.all_lookups[lookup_name]
-            if not self.should_include_lookup(lookup) or lookup_name in processed_lookups:
+            lookup = self.included_lookups.get(lookup_name)
+            if lookup is None or lookup_name in processed_lookups:
                 continue
             
             if feature_name != current_feature:
                 current_feature = feature_name
-                output.append("")
-                output.append("# " + "=" * 76)
-                output.append(f"# Feature: {feature_name}")
-                if lookup.info.scripts:
-                    output.append(f"# Scripts: {', '.join(set(lookup.info.scripts))}")
-                output.append("# " + "=" * 76)
-                output.append("")
+                header_key = (feature_name, lookup.info.scripts_str)
+                header = feature_headers.get(header_key)
+                if header is None:
+                    scripts_line = f"# Scripts: {header_key[1]}\n" if header_key[1] else ""
+                    header = f"\n{_HEADER_EQ}\n# Feature: {feature_name}\n{scripts_line}{_HEADER_EQ}\n\n"
+                    feature_headers[header_key] = header
+                w(header)
             
-            print(f"  Generating output for {lookup_name}", file=sys.stderr)
-            lookup_output = self.generate_lookup_output(lookup)
-            output.extend(lookup_output)
+            if self.verbose:
+                print(f"  Generating output for {lookup_name}", file=sys.stderr)
+            self.write_lookup_output(out, lookup)
             processed_lookups.add(lookup_name)
-        
-        return '\n'.join(output)
 
 
 def main():
@@ -755,6 +780,7 @@ def main():
     parser.add_argument('input', help='Input .fea file')
     parser.add_argument('output', nargs='?', help='Output .aar file (default: stdout)')
     parser.add_argument('--script', '-s', help='Filter by script(s), comma-separated')
+    parser.add_argument('--verbose', action='store_true', help='Print per-lookup progress')
     
     args = parser.parse_args()
     
@@ -763,30 +789,29 @@ def main():
         script_filter = [s.strip() for s in args.script.split(',')]
         print(f"Filtering by scripts: {', '.join(script_filter)}", file=sys.stderr)
     
+    converter = GSUBToAAR(script_filter=script_filter, verbose=args.verbose)
+    
+    # The input is parsed as it is read, without holding the whole file in memory
     try:
         with open(args.input, 'r', encoding='utf-8') as f:
-            content = f.read()
+            converter.parse_lines(f)
     except FileNotFoundError:
         print(f"Error: File not found: {args.input}")
         sys.exit(1)
-    except Exception as e:
+    except (OSError, UnicodeDecodeError) as e:
         print(f"Error reading file: {e}")
         sys.exit(1)
     
-    converter = GSUBToAAR(script_filter=script_filter)
-    converter.parse_file(content)
-    output = converter.generate_output()
-    
     if args.output:
         try:
             with open(args.output, 'w', encoding='utf-8') as f:
-                f.write(output)
+                converter.generate_output(out=f)
             print(f"\nSuccessfully converted to: {args.output}", file=sys.stderr)
-        except Exception as e:
+        except OSError as e:
             print(f"Error writing file: {e}")
             sys.exit(1)
     else:
-        print(output)
+        converter.generate_output(out=sys.stdout)
     
     print(f"\nConversion complete!", file=sys.stderr)
 
@@ -5,9 +5,26 @@ Converts TTX font files to Adobe FEA (Feature File) format
 """
 
 import argparse
-import xml.etree.ElementTree as ET
+import io
+import sys
 from collections import defaultdict
-from typing import Dict, List, Set, Optional, Tuple
+from functools import lru_cache
+from typing import Dict, List, Set, Optional, TextIO, Tuple
+
+# lxml parses large TTX dumps much faster; fall back to the standard library
+try:
+    from lxml import etree as ET
+    LXML_AVAILABLE = True
+except ImportError:
+    import xml.etree.ElementTree as ET
+    LXML_AVAILABLE = False
+
+# Top-level TTX tables kept in memory; everything else is discarded while parsing
+LAYOUT_TABLES = frozenset(['GSUB', 'GPOS', 'GDEF', 'JSTF'])
+
+# Subtable elements that appear directly under a non-extension <Lookup>
+SUBST_TAGS = frozenset(['SingleSubst', 'MultipleSubst', 'AlternateSubst',
+                        'LigatureSubst', 'ContextSubst', 'ChainContextSubst'])
 
 
 class TTXtoFEA:
@@ -15,34 +32,66 @@ class TTXtoFEA:
         self.ttx_file = ttx_file
         self.tables = [t.upper() for t in tables]
         self.scripts = [s.lower() for s in scripts] if scripts else []
-        self.tree = ET.parse(ttx_file)
-        self.root = self.tree.getroot()
+        self.feature_ui_names: Dict[str, str] = {}  # feature tag -> first UINameID found for it
+        self.table_elements = self.load_tables(ttx_file)
+    
+    def load_tables(self, ttx_file: str) -> Dict:
+        """Stream-parse the TTX file, keeping only the layout table elements"""
+        if LXML_AVAILABLE:
+            events = ET.iterparse(ttx_file, events=('start', 'end'), huge_tree=True, collect_ids=False,
+                                  remove_blank_text=True, remove_comments=True)
+        else:
+            events = ET.iterparse(ttx_file, events=('start', 'end'))
+        
+        table_elements = {}
+        depth = 0
+        for event, elem in events:
+            if event == 'start':
+                depth += 1
+                continue
+            depth -= 1
+            # Direct children of <ttFont> are the font tables
+            if depth == 1:
+                if elem.tag in LAYOUT_TABLES:
+                    table_elements.setdefault(elem.tag, elem)
+                else:
+                    elem.clear()
+        
+        return table_elements
         
     def convert(self) -> str:
         """Main conversion method"""
-        fea_output = []
-        fea_output.append("# Generated from TTX file")
-        fea_output.append(f"# Source: {self.ttx_file}\n")
+        buf = io.StringIO()
+        self.write_output(buf)
+        return buf.getvalue()
+    
+    def write_output(self, out: TextIO):
+        """Write FEA output to a text stream, one table section at a time"""
+        w = out.write
+        w("# Generated from TTX file\n")
+        w(f"# Source: {self.ttx_file}\n")
         
         for table in self.tables:
-            if table == 'GSUB':
-                fea_output.append(self.convert_gsub())
-            elif table == 'GPOS':
-                fea_output.append(self.convert_gpos_placeholder())
-            elif table == 'GDEF':
-                fea_output.append(self.convert_gdef_placeholder())
-            elif table == 'JSTF':
-                fea_output.append(self.convert_jstf_placeholder())
-            else:
-                fea_output.append(f"# Table {table} not supported yet\n")
-        
-        return "\n".join(fea_output)
-    
-    def convert_gsub(self) -> str:
-        """Convert GSUB table to FEA format"""
-        gsub = self.root.find('.//GSUB')
+            w("\n")
+            w("\n".join(self.convert_table(table)))
+    
+    def convert_table(self, table: str) -> List[str]:
+        """Convert one table to FEA format lines"""
+        if table == 'GSUB':
+            return self.convert_gsub()
+        elif table == 'GPOS':
+            return [self.convert_gpos_placeholder()]
+        elif table == 'GDEF':
+            return [self.convert_gdef_placeholder()]
+        elif table == 'JSTF':
+            return [self.convert_jstf_placeholder()]
+        return [f"# Table {table} not supported yet\n"]
+    
+    def convert_gsub(self) -> List[str]:
+        """Convert GSUB table to FEA format lines"""
+        gsub = self.table_elements.get('GSUB')
         if gsub is None:
-            return "# GSUB table not found\n"
+            return ["# GSUB table not found\n"]
         
         output = []
         output.append("# ========================================")
@@ -54,17 +103,24 @@ class TTXtoFEA:
         feature_list = gsub.find('FeatureList')
         lookup_list = gsub.find('LookupList')
         
-        if not all([script_list, feature_list, lookup_list]):
-            return "# GSUB table incomplete\n"
+        # Elements are tested explicitly: lxml warns on element truth-testing
+        if any(elem is None or len(elem) == 0 for elem in (script_list, feature_list, lookup_list)):
+            return ["# GSUB table incomplete\n"]
         
         # Extract data
         scripts = self.parse_script_list(script_list)
         features = self.parse_feature_list(feature_list)
-        lookups = self.parse_lookup_list(lookup_list)
         
-        # Filter by requested scripts
+        # Filter by requested scripts, then parse only the lookups they reach
+        wanted = None
         if self.scripts:
             scripts = {k: v for k, v in scripts.items() if k.lower() in self.scripts}
+            wanted = {lookup_idx
+                      for script_data in scripts.values()
+                      for feat_indices in (script_data['default'], *script_data['languages'].values())
+                      for feat_idx in feat_indices
+                      for lookup_idx in features[feat_idx]['lookups']}
+        lookups = self.parse_lookup_list(lookup_list, wanted)
         
         # Generate lookup definitions
         output.append("# ----------------------------------------")
@@ -72,16 +128,17 @@ class TTXtoFEA:
         output.append("# ----------------------------------------\n")
         
         for lookup_idx, lookup_data in sorted(lookups.items()):
-            output.append(self.format_lookup(lookup_idx, lookup_data))
+            output.extend(self.format_lookup(lookup_idx, lookup_data))
         
         # Generate feature definitions with script/language assignments
         output.append("\n# ----------------------------------------")
         output.append("# Feature Definitions")
         output.append("# ----------------------------------------\n")
         
-        output.append(self.format_features(scripts, features, lookups))
+        # An empty feature section still ends the table with a line break
+        output.extend(self.format_features(scripts, features, lookups) or [""])
         
-        return "\n".join(output)
+        return output
     
     def parse_script_list(self, script_list) -> Dict:
         """Parse ScriptList to map scripts -> languages -> features"""
@@ -115,6 +172,7 @@ class TTXtoFEA:
     def parse_feature_list(self, feature_list) -> Dict:
         """Parse FeatureList to map feature indices to tags and lookups"""
         features = {}
+        self.feature_ui_names = {}
         
         for idx, feature_record in enumerate(feature_list.findall('FeatureRecord')):
             feature_tag = feature_record.find('FeatureTag').get('value')
@@ -136,40 +194,64 @@ class TTXtoFEA:
                 'lookups': lookup_indices,
                 'ui_name_id': ui_name_id
             }
+            if ui_name_id and feature_tag not in self.feature_ui_names:
+                self.feature_ui_names[feature_tag] = ui_name_id
         
         return features
     
-    def parse_lookup_list(self, lookup_list) -> Dict:
-        """Parse LookupList and convert to FEA-ready format"""
+    def parse_lookup_list(self, lookup_list, wanted: Optional[Set[int]] = None) -> Dict:
+        """
+        Parse LookupList and convert to FEA-ready format. If wanted is given, only
+        those lookups and the lookups their contextual rules call are parsed.
+        """
         lookups = {}
         
-        for lookup in lookup_list.findall('Lookup'):
-            idx = int(lookup.get('index'))
-            lookup_type = int(lookup.find('LookupType').get('value'))
-            lookup_flag = int(lookup.find('LookupFlag').get('value'))
+        if wanted is None:
+            for lookup in lookup_list.findall('Lookup'):
+                lookups[int(lookup.get('index'))] = self.parse_lookup(lookup)
+            return lookups
+        
+        lookup_elements = {int(lookup.get('index')): lookup for lookup in lookup_list.findall('Lookup')}
+        pending = list(wanted)
+        while pending:
+            idx = pending.pop()
+            if idx in lookups or idx not in lookup_elements:
+                continue
+            lookup_data = self.parse_lookup(lookup_elements[idx])
+            lookups[idx] = lookup_data
             
-            # Get mark filtering set if present
-            mark_filter = lookup.find('MarkFilteringSet')
-            mark_filter_set = int(mark_filter.get('value')) if mark_filter is not None else None
-            
-            # Parse substitution rules
-            rules = self.parse_lookup_subtables(lookup, lookup_type)
-            
-            lookups[idx] = {
-                'type': lookup_type,
-                'flag': lookup_flag,
-                'mark_filter_set': mark_filter_set,
-                'rules': rules
-            }
+            # Follow lookups applied by contextual rules
+            for rule in lookup_data['rules']:
+                for r in rule.get('rules', ()):
+                    pending.extend([lookup_idx for _, lookup_idx in r['lookups']])
         
         return lookups
     
+    def parse_lookup(self, lookup) -> Dict:
+        """Parse a single Lookup element"""
+        lookup_type = int(lookup.find('LookupType').get('value'))
+        lookup_flag = int(lookup.find('LookupFlag').get('value'))
+        
+        # Get mark filtering set if present
+        mark_filter = lookup.find('MarkFilteringSet')
+        mark_filter_set = int(mark_filter.get('value')) if mark_filter is not None else None
+        
+        # Parse substitution rules
+        rules = self.parse_lookup_subtables(lookup, lookup_type)
+        
+        return {
+            'type': lookup_type,
+            'flag': lookup_flag,
+            'mark_filter_set': mark_filter_set,
+            'rules': rules
+        }
+    
     def parse_lookup_subtables(self, lookup, lookup_type: int) -> List:
         """Parse subtables based on lookup type"""
         rules = []
         
-        # Check if this lookup uses ExtensionSubst (Type 7)
-        ext_substs = lookup.findall('.//ExtensionSubst')
+        # Check if this lookup uses ExtensionSubst (Type 7); they are direct children
+        ext_substs = lookup.findall('ExtensionSubst')
         
         if ext_substs:
             # Process extension lookups
@@ -181,12 +263,9 @@ class TTXtoFEA:
                         rules.append(self.parse_substitution(child, actual_type))
                         break
         else:
-            # Handle non-extension lookups (direct children of Lookup)
-            for subst_type in ['SingleSubst', 'MultipleSubst', 'AlternateSubst',
-                              'LigatureSubst', 'ContextSubst', 'ChainContextSubst']:
-                # Only get direct children, not descendants
-                for subst in lookup.findall(f'./{subst_type}'):
-                    rules.append(self.parse_substitution(subst, lookup_type))
+            # Handle non-extension lookups (direct children of Lookup) in one pass
+            rules.extend([self.parse_substitution(subst, lookup_type)
+                          for subst in lookup if subst.tag in SUBST_TAGS])
         
         return rules
     
@@ -211,41 +290,34 @@ class TTXtoFEA:
     
     def parse_single_subst(self, subst) -> Dict:
         """Parse single substitution (one-to-one)"""
-        substitutions = []
-        for sub in subst.findall('Substitution'):
-            in_glyph = sub.get('in')
-            out_glyph = sub.get('out')
-            substitutions.append((in_glyph, out_glyph))
+        intern = sys.intern
+        substitutions = [(intern(sub.get('in')), intern(sub.get('out'))) for sub in subst.findall('Substitution')]
         return {'type': 'single', 'substitutions': substitutions}
     
     def parse_multiple_subst(self, subst) -> Dict:
         """Parse multiple substitution (one-to-many)"""
-        substitutions = []
-        for sub in subst.findall('Substitution'):
-            in_glyph = sub.get('in')
-            out_glyphs = sub.get('out').split(',')
-            substitutions.append((in_glyph, out_glyphs))
+        intern = sys.intern
+        substitutions = [(intern(sub.get('in')), [intern(g) for g in sub.get('out').split(',')])
+                         for sub in subst.findall('Substitution')]
         return {'type': 'multiple', 'substitutions': substitutions}
     
     def parse_alternate_subst(self, subst) -> Dict:
         """Parse alternate substitution"""
-        alternates = {}
-        for alt_set in subst.findall('AlternateSet'):
-            glyph = alt_set.get('glyph')
-            alts = [alt.get('glyph') for alt in alt_set.findall('Alternate')]
-            alternates[glyph] = alts
+        intern = sys.intern
+        alternates = {intern(alt_set.get('glyph')): [intern(alt.get('glyph')) for alt in alt_set.findall('Alternate')]
+                      for alt_set in subst.findall('AlternateSet')}
         return {'type': 'alternate', 'alternates': alternates}
     
     def parse_ligature_subst(self, subst) -> Dict:
         """Parse ligature substitution"""
+        intern = sys.intern
         ligatures = []
         for lig_set in subst.findall('LigatureSet'):
-            first_glyph = lig_set.get('glyph')
+            first_glyph = intern(lig_set.get('glyph'))
             for lig in lig_set.findall('Ligature'):
                 components = lig.get('components')
-                out_glyph = lig.get('glyph')
-                sequence = [first_glyph] + (components.split(',') if components else [])
-                ligatures.append((sequence, out_glyph))
+                sequence = [first_glyph] + [intern(g) for g in components.split(',')] if components else [first_glyph]
+                ligatures.append((sequence, intern(lig.get('glyph'))))
         return {'type': 'ligature', 'ligatures': ligatures}
     
     def parse_context_subst(self, subst) -> Dict:
@@ -261,17 +333,15 @@ class TTXtoFEA:
                 first_glyph = coverage[subrule_set_idx]
                 
                 for subrule in subrule_set.findall('SubRule'):
-                    # Build input sequence (first glyph + additional input glyphs)
+                    # Build input sequence (first glyph + additional input glyphs) and
+                    # lookup applications in one pass over the rule's children
                     input_glyphs = [first_glyph]
-                    for input_elem in subrule.findall('Input'):
-                        input_glyphs.append(input_elem.get('value'))
-                    
-                    # Get lookup applications
                     lookups = []
-                    for record in subrule.findall('SubstLookupRecord'):
-                        seq_idx = int(record.find('SequenceIndex').get('value'))
-                        lookup_idx = int(record.find('LookupListIndex').get('value'))
-                        lookups.append((seq_idx, lookup_idx))
+                    for child in subrule:
+                        if child.tag == 'Input':
+                            input_glyphs.append(sys.intern(child.get('value')))
+                        elif child.tag == 'SubstLookupRecord':
+                            lookups.append(self.parse_lookup_record(child))
                     
                     rules.append({
                         'input': input_glyphs,
@@ -296,19 +366,18 @@ class TTXtoFEA:
         fmt = subst.get('Format')
         
         if fmt == '3':
-            # Format 3: Coverage-based
-            backtrack = [self.parse_coverage(cov)
-                        for cov in subst.findall('BacktrackCoverage')]
-            input_cov = [self.parse_coverage(cov)
-                        for cov in subst.findall('InputCoverage')]
-            lookahead = [self.parse_coverage(cov)
-                        for cov in subst.findall('LookAheadCoverage')]
-            
-            lookups = []
-            for record in subst.findall('SubstLookupRecord'):
-                seq_idx = int(record.find('SequenceIndex').get('value'))
-                lookup_idx = int(record.find('LookupListIndex').get('value'))
-                lookups.append((seq_idx, lookup_idx))
+            # Format 3: Coverage-based; sort the children out in a single pass
+            backtrack, input_cov, lookahead, lookups = [], [], [], []
+            for child in subst:
+                tag = child.tag
+                if tag == 'BacktrackCoverage':
+                    backtrack.append(self.parse_coverage(child))
+                elif tag == 'InputCoverage':
+                    input_cov.append(self.parse_coverage(child))
+                elif tag == 'LookAheadCoverage':
+                    lookahead.append(self.parse_coverage(child))
+                elif tag == 'SubstLookupRecord':
+                    lookups.append(self.parse_lookup_record(child))
             
             rules.append({
                 'backtrack': backtrack,
@@ -319,12 +388,18 @@ class TTXtoFEA:
         
         return {'type': 'chain_context', 'format': fmt, 'rules': rules}
     
+    def parse_lookup_record(self, record) -> Tuple[int, int]:
+        """Parse a SubstLookupRecord to (sequence index, lookup index)"""
+        return (int(record.find('SequenceIndex').get('value')),
+                int(record.find('LookupListIndex').get('value')))
+    
     def parse_coverage(self, coverage) -> List[str]:
         """Parse coverage table to list of glyphs"""
-        return [g.get('value') for g in coverage.findall('Glyph')]
+        intern = sys.intern
+        return [intern(g.get('value')) for g in coverage.iter('Glyph')]
     
-    def format_lookup(self, idx: int, lookup_data: Dict) -> str:
-        """Format a lookup as FEA code"""
+    def format_lookup(self, idx: int, lookup_data: Dict) -> List[str]:
+        """Format a lookup as FEA code lines"""
         output = []
         output.append(f"lookup lookup_{idx} {{")
         
@@ -336,15 +411,15 @@ class TTXtoFEA:
         
         # Add rules
         for rule in lookup_data['rules']:
-            rule_str = self.format_rule(rule, indent="  ")
-            if rule_str:
-                output.append(rule_str)
+            output.extend(self.format_rule(rule, indent="  "))
         
         output.append(f"}} lookup_{idx};\n")
-        return "\n".join(output)
+        return output
     
-    def format_lookup_flag(self, flag: int, mark_filter_set: Optional[int]) -> str:
-        """Format lookup flags"""
+    @staticmethod
+    @lru_cache(maxsize=64)
+    def format_lookup_flag(flag: int, mark_filter_set: Optional[int]) -> str:
+        """Format lookup flags; fonts use only a handful of distinct combinations"""
         flags = []
         if flag & 0x0001:
             flags.append("RightToLeft")
@@ -361,36 +436,24 @@ class TTXtoFEA:
             return "lookupflag " + " ".join(flags) + ";"
         return ""
     
-    def format_rule(self, rule: Dict, indent: str = "") -> str:
-        """Format a substitution rule as FEA"""
+    def format_rule(self, rule: Dict, indent: str = "") -> List[str]:
+        """Format a substitution rule as FEA lines"""
         rule_type = rule['type']
         
         if rule_type == 'single':
-            lines = []
-            for in_g, out_g in rule['substitutions']:
-                lines.append(f"{indent}sub {in_g} by {out_g};")
-            return "\n".join(lines)
+            return [f"{indent}sub {in_g} by {out_g};" for in_g, out_g in rule['substitutions']]
         
         elif rule_type == 'multiple':
-            lines = []
-            for in_g, out_glyphs in rule['substitutions']:
-                out_str = " ".join(out_glyphs)
-                lines.append(f"{indent}sub {in_g} by {out_str};")
-            return "\n".join(lines)
+            return [f"{indent}sub {in_g} by {' '.join(out_glyphs)};"
+                    for in_g, out_glyphs in rule['substitutions']]
         
         elif rule_type == 'alternate':
-            lines = []
-            for glyph, alts in rule['alternates'].items():
-                alt_str = " ".join(alts)
-                lines.append(f"{indent}sub {glyph} from [{alt_str}];")
-            return "\n".join(lines)
+            return [f"{indent}sub {glyph} from [{' '.join(alts)}];"
+                    for glyph, alts in rule['alternates'].items()]
         
         elif rule_type == 'ligature':
-            lines = []
-            for sequence, out_glyph in rule['ligatures']:
-                seq_str = " ".join(sequence)
-                lines.append(f"{indent}sub {seq_str} by {out_glyph};")
-            return "\n".join(lines)
+            return [f"{indent}sub {' '.join(sequence)} by {out_glyph};"
+                    for sequence, out_glyph in rule['ligatures']]
         
         elif rule_type == 'chain_context':
             return self.format_chain_context(rule, indent)
@@ -398,9 +461,9 @@ class TTXtoFEA:
         elif rule_type == 'context':
             return self.format_context(rule, indent)
         
-        return f"{indent}# Unknown rule type: {rule_type}"
+        return [f"{indent}# Unknown rule type: {rule_type}"]
     
-    def format_chain_context(self, rule: Dict, indent: str) -> str:
+    def format_chain_context(self, rule: Dict, indent: str) -> List[str]:
         """Format chaining contextual substitution"""
         lines = []
         for r in rule['rules']:
@@ -417,10 +480,11 @@ class TTXtoFEA:
                 parts.extend(backtrack_classes)
             
             # Input sequence (mark positions that get substituted)
+            lookup_positions = {seq_idx for seq_idx, _ in r['lookups']}
             input_parts = []
             for i, glyphs in enumerate(r['input']):
                 # Check if this position has a lookup applied
-                has_lookup = any(seq_idx == i for seq_idx, _ in r['lookups'])
+                has_lookup = i in lookup_positions
                 if len(glyphs) == 1:
                     glyph_str = glyphs[0]
                 else:
@@ -442,17 +506,13 @@ class TTXtoFEA:
                 parts.extend(lookahead_classes)
             
             # Add lookup references
-            lookup_refs = []
-            for seq_idx, lookup_idx in r['lookups']:
-                lookup_refs.append(f"lookup_{lookup_idx}")
-            
             context_str = " ".join(parts)
-            lookup_str = " ".join(lookup_refs)
+            lookup_str = " ".join([f"lookup_{lookup_idx}" for _, lookup_idx in r['lookups']])
             lines.append(f"{indent}sub {context_str} by {lookup_str};")
         
-        return "\n".join(lines)
+        return lines
     
-    def format_context(self, rule: Dict, indent: str) -> str:
+    def format_context(self, rule: Dict, indent: str) -> List[str]:
         """Format contextual substitution (non-chaining)"""
         fmt = rule.get('format')
         
@@ -476,40 +536,46 @@ class TTXtoFEA:
                 context_str = " ".join(parts)
                 lines.append(f"{indent}sub {context_str};")
             
-            return "\n".join(lines)
+            return lines
         else:
-            return f"{indent}# TODO: Contextual substitution format {fmt}"
+            return [f"{indent}# TODO: Contextual substitution format {fmt}"]
     
-    def format_features(self, scripts: Dict, features: Dict, lookups: Dict) -> str:
-        """Format feature definitions with script/language assignments"""
+    def format_features(self, scripts: Dict, features: Dict, lookups: Dict) -> List[str]:
+        """Format feature definitions with script/language assignments as lines"""
         output = []
         
+        # Deduplicate each feature's lookups once, preserving order, and render the
+        # lookup references at script and language indentation
+        unique_lookups = {idx: tuple(dict.fromkeys(feat_data['lookups']))
+                          for idx, feat_data in features.items()}
+        script_lookup_refs = {idx: "\n".join([f"  lookup lookup_{lookup_idx};" for lookup_idx in lookup_indices])
+                              for idx, lookup_indices in unique_lookups.items()}
+        language_lookup_refs = {idx: "\n".join([f"    lookup lookup_{lookup_idx};" for lookup_idx in lookup_indices])
+                                for idx, lookup_indices in unique_lookups.items()}
+        
         # Build mapping: feature_tag -> script -> lang -> feature_index
-        feature_map = defaultdict(lambda: defaultdict(dict))
+        feature_map: Dict[str, Dict[str, Dict[str, int]]] = {}
         
         for script_tag, script_data in scripts.items():
             # Default language
             for feat_idx in script_data['default']:
-                feat_tag = features[feat_idx]['tag']
-                if 'dflt' not in feature_map[feat_tag][script_tag]:
-                    feature_map[feat_tag][script_tag]['dflt'] = feat_idx
+                lang_map = feature_map.setdefault(features[feat_idx]['tag'], {}).setdefault(script_tag, {})
+                lang_map.setdefault('dflt', feat_idx)
             
             # Specific languages
             for lang_tag, feat_indices in script_data['languages'].items():
                 for feat_idx in feat_indices:
-                    feat_tag = features[feat_idx]['tag']
-                    if lang_tag not in feature_map[feat_tag][script_tag]:
-                        feature_map[feat_tag][script_tag][lang_tag] = feat_idx
+                    lang_map = feature_map.setdefault(features[feat_idx]['tag'], {}).setdefault(script_tag, {})
+                    lang_map.setdefault(lang_tag, feat_idx)
         
         # Generate feature blocks
         for feat_tag in sorted(feature_map.keys()):
             output.append(f"\nfeature {feat_tag} {{")
             
             # Add UI name comment if present in any variant
-            for feat_data in features.values():
-                if feat_data['tag'] == feat_tag and feat_data['ui_name_id']:
-                    output.append(f"  # UINameID: {feat_data['ui_name_id']}")
-                    break
+            ui_name_id = self.feature_ui_names.get(feat_tag)
+            if ui_name_id:
+                output.append(f"  # UINameID: {ui_name_id}")
             
             # Process each script
             script_map = feature_map[feat_tag]
@@ -522,17 +588,12 @@ class TTXtoFEA:
                 if len(feat_indices) == 1:
                     # All languages use same feature definition
                     feat_idx = list(feat_indices)[0]
-                    output.append(f"  script {script_tag};")
                     
                     # Add lookups once for this script
-                    if features[feat_idx]['lookups']:
-                        output.append("")
-                        # Deduplicate lookups while preserving order
-                        seen = set()
-                        for lookup_idx in features[feat_idx]['lookups']:
-                            if lookup_idx not in seen:
-                                output.append(f"  lookup lookup_{lookup_idx};")
-                                seen.add(lookup_idx)
+                    if unique_lookups[feat_idx]:
+                        output.append(f"  script {script_tag};\n\n{script_lookup_refs[feat_idx]}")
+                    else:
+                        output.append(f"  script {script_tag};")
                 else:
                     # Different languages have different feature definitions
                     output.append(f"  script {script_tag};")
@@ -540,29 +601,21 @@ class TTXtoFEA:
                     # Handle default first
                     if 'dflt' in lang_map:
                         feat_idx = lang_map['dflt']
-                        if features[feat_idx]['lookups']:
-                            output.append("    # Default language system")
-                            seen = set()
-                            for lookup_idx in features[feat_idx]['lookups']:
-                                if lookup_idx not in seen:
-                                    output.append(f"  lookup lookup_{lookup_idx};")
-                                    seen.add(lookup_idx)
+                        if unique_lookups[feat_idx]:
+                            output.append(f"    # Default language system\n{script_lookup_refs[feat_idx]}")
                     
                     # Handle specific languages
                     for lang_tag in sorted(lang_map.keys()):
                         if lang_tag != 'dflt':
                             feat_idx = lang_map[lang_tag]
-                            output.append(f"    language {lang_tag};")
-                            if features[feat_idx]['lookups']:
-                                seen = set()
-                                for lookup_idx in features[feat_idx]['lookups']:
-                                    if lookup_idx not in seen:
-                                        output.append(f"    lookup lookup_{lookup_idx};")
-                                        seen.add(lookup_idx)
+                            if unique_lookups[feat_idx]:
+                                output.append(f"    language {lang_tag};\n{language_lookup_refs[feat_idx]}")
+                            else:
+                                output.append(f"    language {lang_tag};")
             
             output.append(f"}} {feat_tag};\n")
         
-        return "\n".join(output)
+        return output
     
     def find_feature_scripts(self, feature_tag: str, scripts: Dict,
                             features: Dict) -> Dict[str, List[str]]:
@@ -630,15 +683,15 @@ def main():
     
     # Convert
     converter = TTXtoFEA(args.input, args.table, args.script)
-    fea_output = converter.convert()
     
     # Output
     if args.output:
         with open(args.output, 'w', encoding='utf-8') as f:
-            f.write(fea_output)
+            converter.write_output(f)
         print(f"FEA file written to {args.output}")
     else:
-        print(fea_output)
+        converter.write_output(sys.stdout)
+        sys.stdout.write("\n")
 
 
 if __name__ == '__main__':